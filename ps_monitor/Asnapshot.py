@@ -2,6 +2,7 @@ import sys
 import zmq
 import time
 import argparse
+from ps_monitor.broker import BrokerClient
 
 # Socket to talk to server
 context = zmq.Context()
@@ -9,7 +10,7 @@ socket = context.socket(zmq.SUB)
 socket.setsockopt(zmq.SUBSCRIBE, b'')  # Subscribe to everything
 
 
-def recv_data(channels, port, ip):
+def recv_data(channels, port, ip, broker=None):
 
     #print info header info
     print('# Date: %s \n' % time.asctime())
@@ -17,21 +18,29 @@ def recv_data(channels, port, ip):
     # try-except clause for ending logger
     try:
         print("Collecting data from RaspberryPi...")
-        # connecting to specified ip address and port
-        socket.connect("tcp://%s:%s" % (ip, port))
+        if broker is not None:
+            # receive the data of RPi named broker from the local broker
+            sub = BrokerClient(context, rpis=[broker], name='snapshot %s' % broker)
+        else:
+            # connecting to specified ip address and port
+            socket.connect("tcp://%s:%s" % (ip, port))
+            sub = socket
         print("START") 
     
         clear_on_volts=[]
         sw_refin_volts=[]
         clear_off_volts=[]
         sw_sub_volts=[]
+        last_data = {}
         for i in range(200):
             # receive actual voltage values including timestamp
-            data = socket.recv_json()
+            data = sub.recv_json()
 
             _meta, _data = data['meta'], data['data']
 
-            write_data = [time.time(), _meta['timestamp']] + [_data[ch] for ch in channels]
+            # Senders in deadband mode leave out unchanged channels, which keep their last value
+            last_data.update(_data)
+            write_data = [time.time(), _meta['timestamp']] + [last_data.get(ch, float('nan')) for ch in channels]
             clear_on_volts.append(write_data[2])
             sw_refin_volts.append(write_data[3])
             clear_off_volts.append(write_data[4])
@@ -44,6 +53,9 @@ def recv_data(channels, port, ip):
     except KeyboardInterrupt:
         print('\nStopping logger...\nClosing data file...')
 
+    # Deregisters from the broker
+    sub.close()
+
     mean_clear_on = sum(clear_on_volts)/(len(clear_on_volts))
     mean_sw_refin = sum(sw_refin_volts)/(len(sw_refin_volts))
     mean_clear_off = sum(clear_off_volts)/(len(clear_off_volts))
@@ -64,9 +76,13 @@ if __name__ == '__main__':
     # parse args from command line
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--channels', help='Channel names', required=True)
-    parser.add_argument('-ip', '--ip_address', help='IP address', required=True)
-    parser.add_argument('-p', '--port', help='Port', required=True)
+    parser.add_argument('-ip', '--ip_address', help='IP address')
+    parser.add_argument('-p', '--port', help='Port')
+    parser.add_argument('--broker', help='Name of the RPi to receive from the local broker instead of IP address and port')
     args = vars(parser.parse_args())
 
-    recv_data(channels=args['channels'].split(' '), ip=args['ip_address'], port=args['port'])
+    if args['broker'] is None and not (args['ip_address'] and args['port']):
+        parser.error('IP address and port are required if not receiving from the broker')
+
+    recv_data(channels=args['channels'].split(' '), ip=args['ip_address'], port=args['port'], broker=args['broker'])
 
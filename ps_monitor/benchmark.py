@@ -0,0 +1,606 @@
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+from collections import OrderedDict
+
+from ps_monitor import data_receiver
+
+
+def _supply_rail_data(n_samples, n_channels, rate=1000.):
+    # Representative supply-rail data: DC level per channel with some mains ripple and white noise
+    t = time.time() + np.arange(n_samples) / rate
+    dc = np.linspace(-2., 5., n_channels)
+    ripple = 2e-3 * np.sin(2 * np.pi * 50. * (t - t[0]))[:, None]
+    noise = np.random.normal(scale=5e-4, size=(n_samples, n_channels))
+    return t, (dc + ripple + noise).astype(np.float32)
+
+
+def bench_writer(n_samples=100000, n_channels=4, block_size=1000):
+    """
+    Compare sustained samples/s of the per-sample text output with the block writer of the data receiver.
+    """
+    timestamps, values = _supply_rail_data(n_samples, n_channels)
+    channels = ['CH%i' % i for i in range(n_channels)]
+    tmp_dir = tempfile.mkdtemp()
+
+    results = []
+    try:
+        # Original implementation: one formatted write per sample
+        outfile = os.path.join(tmp_dir, 'line.dat')
+        start = time.time()
+        with open(outfile, 'a') as out:
+            out.write(data_receiver._header(channels))
+            for i in range(n_samples):
+                data_receiver._write_line(out, [timestamps[i], timestamps[i]] + values[i].tolist())
+        results.append(('line', time.time() - start, os.path.getsize(outfile)))
+
+        for fmt in ('txt', 'h5'):
+            outfile = os.path.join(tmp_dir, 'block.' + fmt)
+            start = time.time()
+            writer = data_receiver.BlockWriter(outfile=outfile, channels=channels, fmt=fmt, block_size=block_size)
+            for i in range(n_samples):
+                writer.add(timestamps[i], timestamps[i], values[i])
+            writer.close()
+            results.append((fmt, time.time() - start, os.path.getsize(outfile)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print('Writing %i samples of %i channel(s), block size %i' % (n_samples, n_channels, block_size))
+    for fmt, duration, size in results:
+        print('%-6s %12.0f samples/s %10.2f MB' % (fmt, n_samples / duration, size / 1e6))
+
+    return results
+
+
+# HDF5 settings compared by bench_hdf5, same keys as the 'hdf5' table config of the logger
+hdf5_settings = OrderedDict([('default', {}),
+                             ('zlib-5', {'complib': 'zlib', 'complevel': 5}),
+                             ('lz4-5-shuffle', {'complib': 'blosc:lz4', 'complevel': 5, 'shuffle': True}),
+                             ('lz4-5-bitshuffle', {'complib': 'blosc:lz4', 'complevel': 5, 'bitshuffle': True}),
+                             ('zstd-5-bitshuffle', {'complib': 'blosc:zstd', 'complevel': 5, 'bitshuffle': True}),
+                             ('lz4-5-bitshuffle-q', {'complib': 'blosc:lz4', 'complevel': 5, 'bitshuffle': True, 'quantize': True}),
+                             ('zstd-5-bitshuffle-q', {'complib': 'blosc:zstd', 'complevel': 5, 'bitshuffle': True, 'quantize': True})])
+
+
+def bench_hdf5(n_samples=20000, n_channels=4, n_digits=5, settings=None):
+    """
+    Write throughput, CPU time and file size of the logger data table for different HDF5 settings.
+    Rows are appended one at a time, like logger.logger does.
+    """
+    import tables as tb
+    from ps_monitor.logger import _create_table, _quantize
+
+    settings = settings or list(hdf5_settings)
+    timestamps, values = _supply_rail_data(n_samples, n_channels)
+    channels = ['CH%i' % i for i in range(n_channels)]
+    data_type = [('timestamp_recv', '<f8'), ('timestamp_data', '<f8')] + [(ch, '<f4') for ch in channels]
+    tmp_dir = tempfile.mkdtemp()
+
+    results = []
+    try:
+        for name in settings:
+            table_config = hdf5_settings[name]
+            quantize = table_config.get('quantize', False)
+            outfile = os.path.join(tmp_dir, name + '.h5')
+
+            start, cpu_start = time.time(), time.process_time()
+
+            out = tb.open_file(outfile, 'w')
+            out.create_group(out.root, "RPiData")
+            data_buffer = np.zeros(shape=1, dtype=data_type)
+            data_table = _create_table(out, name="data", description=data_buffer.dtype, table_config=table_config)
+
+            for i in range(n_samples):
+                data_buffer["timestamp_data"] = timestamps[i]
+                for j, ch in enumerate(channels):
+                    data_buffer[ch] = values[i, j]
+                if quantize:
+                    _quantize(data_buffer, channels, n_digits)
+                data_table.append(data_buffer)
+            out.close()
+
+            duration, cpu = time.time() - start, time.process_time() - cpu_start
+            results.append((name, n_samples / duration, cpu, os.path.getsize(outfile)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print('Writing %i rows of %i channel(s)' % (n_samples, n_channels))
+    for name, rows_per_s, cpu, size in results:
+        print('%-20s %10.0f rows/s %8.2f s CPU %10.3f MB' % (name, rows_per_s, cpu, size / 1e6))
+
+    return results
+
+
+class _SimulatedSSHClient(object):
+    # Answers the commands deploy runs through the SSH client of the process manager
+
+    def __init__(self, machine_id, latency):
+        self.machine_id = machine_id
+        self.latency = latency
+
+    def exec_command(self, cmd):
+        time.sleep(self.latency)
+        return None, io.BytesIO((self.machine_id + '\n').encode()), io.BytesIO()
+
+
+class SimulatedProcessManager(object):
+    """
+    Local stand-in for irrad_control.utils.proc_manager.ProcessManager which sleeps instead of talking to the RPis.
+    Hosts listed in *failing* raise on connect. The machine id of a host is its hostname unless given in *machine_ids*.
+    """
+
+    def __init__(self, latency=0.2, copy_latency=0.5, configure_latency=5., failing=(), machine_ids=None):
+        self.latency = latency
+        self.copy_latency = copy_latency
+        self.configure_latency = configure_latency
+        self.failing = failing
+        self.machine_ids = machine_ids or {}
+        self.client = {}
+        self.calls = []
+
+    def connect_to_server(self, hostname, username):
+        self.calls.append(('connect', hostname))
+        time.sleep(self.latency)
+        if hostname in self.failing:
+            raise IOError('Could not connect to {}@{}'.format(username, hostname))
+        self.client[hostname] = _SimulatedSSHClient(self.machine_ids.get(hostname, hostname), self.latency)
+
+    def configure_server(self, hostname, branch=None, git_pull=False):
+        self.calls.append(('configure', hostname))
+        time.sleep(self.configure_latency)
+
+    def copy_to_server(self, hostname, local_filepath, remote_filepath):
+        self.calls.append(('copy', hostname, remote_filepath))
+        time.sleep(self.copy_latency)
+
+    def _exec_cmd(self, hostname, cmd):
+        self.calls.append(('exec', hostname, cmd))
+        time.sleep(self.latency)
+
+
+def bench_deploy(n_rpis=8, latency=0.2, copy_latency=0.5, configure_latency=5., max_workers=None):
+    """
+    Deployment duration to n_rpis simulated RPis: sequential first run, parallel first run and parallel unchanged re-run.
+    """
+    from ps_monitor.deploy import deploy
+
+    rpis = OrderedDict(('Pi%i' % i, {'ip': '10.0.0.%i' % (i + 1), 'channels': ['A', 'B'], 'log_type': 'sw'}) for i in range(n_rpis))
+    pm = SimulatedProcessManager(latency=latency, copy_latency=copy_latency, configure_latency=configure_latency)
+    tmp_dir = tempfile.mkdtemp()
+    manifest_file = os.path.join(tmp_dir, 'manifest.yaml')
+
+    results = []
+    try:
+        for name, workers, manifest in (('sequential', 1, None),
+                                        ('parallel', max_workers, manifest_file),
+                                        ('parallel, unchanged', max_workers, manifest_file)):
+            start = time.time()
+            deploy(pm=pm, rpis=rpis, max_workers=workers, manifest_file=manifest, config_dir=tmp_dir)
+            results.append((name, time.time() - start))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print('Deploying to %i simulated RPi(s)' % n_rpis)
+    for name, duration in results:
+        print('%-20s %8.2f s' % (name, duration))
+
+    return results
+
+
+def bench_trigger(n_samples=100000, n_channels=4, block_size=100, n_spikes=10, scan_rate=1000.):
+    """
+    CPU cost of evaluating trigger conditions per sample and trigger latency of the logger TriggerEngine.
+    The latency is measured from adding the trigger sample to its detection. On the RPi, waiting for the block to fill
+    adds up to block_size / scan_rate on top.
+    """
+    from ps_monitor.logger import TriggerEngine
+
+    _, values = _supply_rail_data(n_samples, n_channels, rate=scan_rate)
+    spikes = np.linspace(0, n_samples, n_spikes + 2).astype(int)[1:-1]
+    values[spikes, 0] += 0.1
+
+    channels = ['CH%i' % i for i in range(n_channels)]
+    dc = np.linspace(-2., 5., n_channels)
+    conditions = dict((ch, [{'threshold': dc[i] + 0.05, 'slope': 'rising'}, {'window': [dc[i] - 0.05, dc[i] + 0.05]}])
+                      for i, ch in enumerate(channels))
+
+    engine = TriggerEngine(channels=channels, conditions=conditions, pre_samples=500, post_samples=500, block_size=block_size)
+
+    events = []
+    start = time.time()
+    for i in range(n_samples):
+        events.extend(engine.add(time.time(), values[i]))
+    events.extend(engine.flush())
+    duration = time.time() - start
+
+    latencies = np.array([ev[0]['latency'] for ev in events])
+
+    print('Triggering on %i samples of %i channel(s) with %i conditions, block size %i' % (n_samples, n_channels, 2 * n_channels, block_size))
+    print('Events: %i of %i spikes' % (len(events), n_spikes))
+    print('Evaluation: %.3f us/sample, total incl. buffering: %.3f us/sample' % (1e6 * engine.eval_time / engine.n_evaluated, 1e6 * duration / n_samples))
+    if len(latencies):
+        print('Latency: mean %.3f ms, max %.3f ms (+ up to %.1f ms block filling at %.0f Hz)'
+              % (1e3 * latencies.mean(), 1e3 * latencies.max(), 1e3 * block_size / scan_rate, scan_rate))
+
+    return engine, events
+
+
+def bench_limits(n_samples=100000, n_channels=4, n_alarms=100, port=5599):
+    """
+    CPU cost per scan of the logger LimitEngine and detection-to-notification latency of alarms sent on a local
+    alarm socket, measured from the sample timestamp to the reception by a subscriber.
+    """
+    import zmq
+    from ps_monitor.logger import LimitEngine
+
+    timestamps, values = _supply_rail_data(n_samples, n_channels)
+    violations = np.linspace(0, n_samples, n_alarms + 2).astype(int)[1:-1]
+    values[violations, 0] += 0.1
+
+    channels = ['CH%i' % i for i in range(n_channels)]
+    dc = np.linspace(-2., 5., n_channels)
+    channel_limits = dict((ch, {'min': dc[i] - 0.05, 'max': dc[i] + 0.05, 'rate': 1e3}) for i, ch in enumerate(channels))
+    relations = [{'channels': [channels[i], channels[i + 1]], 'max': 0.} for i in range(n_channels - 1)]
+
+    engine = LimitEngine(channels=channels, channel_limits=channel_limits, relations=relations)
+
+    context = zmq.Context()
+    pub = context.socket(zmq.PUB)
+    pub.bind('tcp://127.0.0.1:%i' % port)
+    sub = context.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, b'')
+    sub.connect('tcp://127.0.0.1:%i' % port)
+    time.sleep(0.5)
+
+    latencies = []
+    check_time = 0.
+    for i in range(n_samples):
+        timestamp = time.time()
+        check_start = time.time()
+        alarms = engine.check(timestamp, values[i])
+        check_time += time.time() - check_start
+        if alarms:
+            pub.send_json({'meta': {'timestamp': timestamp}, 'alarms': alarms})
+            msg = sub.recv_json()
+            latencies.append(time.time() - msg['meta']['timestamp'])
+
+    pub.close()
+    sub.close()
+    context.term()
+
+    latencies = np.array(latencies)
+    print('Checking %i scans of %i channel(s) with %i limits' % (n_samples, n_channels, np.isfinite(engine._limits).sum()))
+    print('Check: %.3f us/scan, %i alarm(s)' % (1e6 * check_time / n_samples, engine.n_alarms))
+    if len(latencies):
+        print('Detection to notification: mean %.3f ms, max %.3f ms' % (1e3 * latencies.mean(), 1e3 * latencies.max()))
+
+    return engine, latencies
+
+
+def bench_spectrum(n_channels=4, rate=1000., duration=60., nperseg=1024, overlap=0.5, block_segments=(1, 4, 16)):
+    """
+    CPU cost of the streaming Welch PSD estimator of the receiving logger, as fraction of one core per channel at the
+    given scan rate, for different numbers of segments transformed at once. The rate is at most the drate of the ADC.
+    The 50 Hz ripple of the data is reported as check of the estimate.
+    """
+    from ps_monitor.spectrum import WelchPSD
+
+    n_samples = int(duration * rate)
+    timestamps, values = _supply_rail_data(n_samples, n_channels, rate=rate)
+    channels = ['CH%i' % i for i in range(n_channels)]
+
+    results = []
+    for n_segments in block_segments:
+        welch = WelchPSD(channels=channels, nperseg=nperseg, overlap=overlap, interval=duration / 4.,
+                         bands={'mains': [45., 55.]}, block_segments=n_segments)
+
+        # CPU time of the transforms alone, without adding the samples one by one
+        process_time = [0.]
+        _process = welch._process
+
+        def _timed_process():
+            process_start = time.process_time()
+            _process()
+            process_time[0] += time.process_time() - process_start
+
+        welch._process = _timed_process
+
+        spectra = []
+        cpu_start = time.process_time()
+        for i in range(n_samples):
+            spectra.extend(welch.add(timestamps[i], values[i]))
+        spectra.extend(welch.flush())
+        cpu = time.process_time() - cpu_start
+
+        ripple = np.mean([s['ripple']['mains'] for s in spectra])
+        results.append((n_segments, cpu, process_time[0], ripple))
+
+    print('Welch PSD of %.0f s of %i channel(s) at %.0f Hz, %i samples per segment, %.0f %% overlap'
+          % (duration, n_channels, rate, nperseg, 1e2 * overlap))
+    for n_segments, cpu, transform, ripple in results:
+        print('%3i segment(s) per block: %8.3f %% CPU per channel (transforms %.3f %%), 50 Hz ripple %.3f mV'
+              % (n_segments, 1e2 * cpu / duration / n_channels, 1e2 * transform / duration / n_channels, 1e3 * ripple))
+
+    return results
+
+
+class SimulatedADC(object):
+    """
+    Local stand-in for pipyadc.ADS1256 with the timing of the input multiplexer: a conversion after switching the
+    multiplexer or a sync takes the settling time of the data rate, a continued conversion one data period.
+    Every read takes *overhead* seconds on top, for SPI transfers. Inputs are DC levels per multiplexer setting.
+    """
+
+    def __init__(self, drate=1000, overhead=2e-4, levels=None):
+        from ps_monitor.logger import ads1256_settling_times
+
+        self.drate = drate
+        self.overhead = overhead
+        self.levels = levels or {}
+        self.settling_time = ads1256_settling_times[drate]
+        self.v_ref = 2.5
+
+        self.pga_gain = 1
+        self.ofc = 0
+        self.fsc = 0
+        self.mux = 0
+        self.n_reads = 0
+        self._converting = 0
+        self._ready = time.time()
+
+    @property
+    def v_per_digit(self):
+        return self.v_ref * 2.0 / (self.pga_gain * (2 ** 23 - 1))
+
+    def _wait(self):
+        delay = self._ready - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _result(self):
+        self.n_reads += 1
+        time.sleep(self.overhead)
+        return int(self.levels.get(self._converting, 0.) / self.v_per_digit)
+
+    def wait_DRDY(self):
+        self._wait()
+
+    def cal_self(self):
+        self.sync()
+
+    def cal_self_offset(self):
+        self.sync()
+
+    def cal_system_offset(self):
+        self.sync()
+
+    def sync(self):
+        self._converting = self.mux
+        self._ready = time.time() + self.settling_time
+
+    def read_async(self):
+        self._wait()
+        result = self._result()
+        self._ready = max(self._ready + 1. / self.drate, time.time())
+        return result
+
+    def read_and_next_is(self, diff_channel):
+        self._wait()
+        self.mux = diff_channel
+        result = self._result()
+        self.sync()
+        return result
+
+    def read_continue(self, ch_sequence):
+        return [self.read_and_next_is(ch_sequence[(i + 1) % len(ch_sequence)]) for i in range(len(ch_sequence))]
+
+
+def bench_schedule(channels=('CH0:500', 'CH1:1:8', 'CH2:10', 'CH3'), drate=1000, duration=5., overhead=2e-4):
+    """
+    Achieved per-channel rates of the logger ScanSchedule against targets on a simulated ADC, compared to reading all
+    channels every scan with read_continue. Channels are given as name[:rate[:gain]].
+    """
+    from ps_monitor.logger import ScanSchedule
+
+    names, channel_config = [], {}
+    for spec in channels:
+        fields = spec.split(':')
+        names.append(fields[0])
+        channel_config[fields[0]] = {'rate': float(fields[1]) if len(fields) > 1 and fields[1] else None,
+                                     'gain': int(fields[2]) if len(fields) > 2 else 1}
+    actual_channels = list(range(len(names)))
+
+    # All channels every scan, as without schedule
+    adc = SimulatedADC(drate=drate, overhead=overhead)
+    start = time.time()
+    n_scans = 0
+    while time.time() - start < duration:
+        adc.read_continue(actual_channels)
+        n_scans += 1
+    flat_rate = n_scans / (time.time() - start)
+
+    compile_start = time.time()
+    schedule = ScanSchedule(channels=names, actual_channels=actual_channels, drate=drate, pga_gain=1,
+                            channel_config=channel_config, overhead=overhead)
+    compile_time = time.time() - compile_start
+
+    adc = SimulatedADC(drate=drate, overhead=overhead)
+    offset_volts = schedule.calibrate(adc)
+    start = time.time()
+    while time.time() - start < duration:
+        schedule.read(adc, offset_volts)
+    achieved = schedule.achieved_rates()
+
+    print('Schedule of %i reads in %.3f s, compiled in %.1f ms, drate %i, %.2f ms overhead per read'
+          % (len(schedule.sequence), schedule.cycle_time, 1e3 * compile_time, drate, 1e3 * overhead))
+    print('%-10s %6s %12s %12s %12s %12s' % ('channel', 'gain', 'target / Hz', 'planned / Hz', 'achieved / Hz', 'flat / Hz'))
+    for i, ch in enumerate(names):
+        print('%-10s %6i %12s %12.2f %12.2f %12.2f' % (ch, schedule.gains[i], '%.2f' % schedule.targets[i] if schedule.targets[i] else '-',
+                                                      schedule.planned_rates[i], achieved[i], flat_rate))
+    print('Total: %.0f reads/s scheduled, %.0f reads/s flat' % (sum(achieved), flat_rate * len(names)))
+
+    return schedule, achieved, flat_rate
+
+
+# Real-time settings compared by bench_realtime, as the realtime config of the logger
+realtime_settings = OrderedDict([
+    ('none', {}),
+    ('gc-freeze', {'gc': 'freeze'}),
+    ('gc-disable', {'gc': 'disable', 'gc_interval': 1.}),
+    ('nice', {'nice': -10, 'gc': 'disable', 'gc_interval': 1.}),
+    ('cpu', {'cpu': 0, 'gc': 'disable', 'gc_interval': 1.}),
+    ('fifo', {'cpu': 0, 'priority': 50, 'gc': 'disable', 'gc_interval': 1.}),
+])
+
+
+def _realtime_loop(setting, period, duration, n_objects, queue):
+    # Acquisition-like loop in its own process: a scan dict and a few lists per loop, with many long-lived objects
+    # from the setup which every collection of the oldest generation has to traverse
+    from ps_monitor.logger import RealtimeTuning, LoopTimer
+
+    tuning = RealtimeTuning(cpu=setting.get('cpu'), priority=setting.get('priority'), nice=setting.get('nice'),
+                            gc=setting.get('gc', 'enabled'), gc_interval=setting.get('gc_interval', 10.))
+    tuning.apply()
+    timer = LoopTimer()
+
+    setup = [{'values': [float(i)], 'name': str(i)} for i in range(n_objects)]
+    cycles = []
+
+    tuning.start()
+    start = next_loop = time.time()
+    while time.time() - start < duration:
+        timer.tick(time.time())
+        scan = {'meta': {'timestamp': time.time()}, 'data': dict(('CH%i' % i, [float(i)] * 4) for i in range(8))}
+        # Reference cycles, which only the cyclic collector frees
+        scan['self'] = scan
+        cycles.append(scan)
+        if len(cycles) > 100:
+            del cycles[:50]
+        tuning.collect()
+        next_loop += period
+        time.sleep(max(0., next_loop - time.time()))
+    tuning.stop()
+
+    queue.put({'errors': tuning.errors, 'n_loops': int(timer.period.sum()), 'n_collections': tuning.n_collections,
+               'max_collect_time': tuning.max_collect_time,
+               'p50': timer.percentile(50), 'p99': timer.percentile(99), 'p999': timer.percentile(99.9),
+               'max': timer.max_period, 'jitter_p99': timer.percentile(99, timer.jitter)})
+    del setup
+
+
+def bench_realtime(settings=None, period=1e-3, duration=10., n_objects=1000000):
+    """
+    Loop period and jitter of an acquisition-like loop with each real-time setting of the logger, each in a new
+    process. Settings which need permissions, e.g. 'fifo' and 'nice', fall back and report why.
+    """
+    import multiprocessing
+
+    results = OrderedDict()
+    for name in settings or list(realtime_settings):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_realtime_loop, args=(realtime_settings[name], period, duration, n_objects, queue))
+        process.start()
+        results[name] = queue.get()
+        process.join()
+
+    print('Loop period %.3f ms, %.0f s per setting, %i long-lived objects' % (1e3 * period, duration, n_objects))
+    print('%-12s %10s %10s %10s %10s %12s %8s' % ('setting', 'p50 / ms', 'p99 / ms', 'p99.9 / ms', 'max / ms', 'jitter p99', 'GC'))
+    for name, res in results.items():
+        print('%-12s %10.3f %10.3f %10.3f %10.3f %12.3f %8s' % (name, 1e3 * res['p50'], 1e3 * res['p99'], 1e3 * res['p999'],
+                                                               1e3 * res['max'], 1e3 * res['jitter_p99'],
+                                                               '%i' % res['n_collections'] if res['n_collections'] else '-'))
+        for error in res['errors']:
+            print('%-12s not applied, %s' % ('', error))
+
+    return results
+
+
+def main(argv=None):
+
+    # parse args from command line
+    parser = argparse.ArgumentParser(prog='ps_monitor benchmark', description='Benchmarks of the ps_monitor data path')
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    writer_parser = subparsers.add_parser('writer', help='Sustained samples/s of the data receiver output formats')
+    writer_parser.add_argument('-n', '--n_samples', type=int, default=100000)
+    writer_parser.add_argument('-c', '--n_channels', type=int, default=4)
+    writer_parser.add_argument('-b', '--block_size', type=int, default=1000)
+
+    hdf5_parser = subparsers.add_parser('hdf5', help='Write throughput, CPU and file size of HDF5 compression settings')
+    hdf5_parser.add_argument('-n', '--n_samples', type=int, default=20000)
+    hdf5_parser.add_argument('-c', '--n_channels', type=int, default=4)
+    hdf5_parser.add_argument('-d', '--n_digits', type=int, default=5)
+    hdf5_parser.add_argument('-s', '--settings', nargs='+', choices=list(hdf5_settings), default=None)
+
+    deploy_parser = subparsers.add_parser('deploy', help='Deployment duration to simulated RPis')
+    deploy_parser.add_argument('-n', '--n_rpis', type=int, default=8)
+    deploy_parser.add_argument('-l', '--latency', type=float, default=0.2)
+    deploy_parser.add_argument('--copy_latency', type=float, default=0.5)
+    deploy_parser.add_argument('--configure_latency', type=float, default=5.)
+    deploy_parser.add_argument('-w', '--max_workers', type=int, default=None)
+
+    trigger_parser = subparsers.add_parser('trigger', help='Trigger condition CPU cost and latency')
+    trigger_parser.add_argument('-n', '--n_samples', type=int, default=100000)
+    trigger_parser.add_argument('-c', '--n_channels', type=int, default=4)
+    trigger_parser.add_argument('-b', '--block_size', type=int, default=100)
+    trigger_parser.add_argument('-s', '--n_spikes', type=int, default=10)
+    trigger_parser.add_argument('-r', '--scan_rate', type=float, default=1000.)
+
+    limits_parser = subparsers.add_parser('limits', help='Limit check CPU cost and alarm latency')
+    limits_parser.add_argument('-n', '--n_samples', type=int, default=100000)
+    limits_parser.add_argument('-c', '--n_channels', type=int, default=4)
+    limits_parser.add_argument('-a', '--n_alarms', type=int, default=100)
+    limits_parser.add_argument('-p', '--port', type=int, default=5599)
+
+    spectrum_parser = subparsers.add_parser('spectrum', help='Streaming Welch PSD CPU cost per channel')
+    spectrum_parser.add_argument('-c', '--n_channels', type=int, default=4)
+    spectrum_parser.add_argument('-r', '--rate', type=float, default=1000.)
+    spectrum_parser.add_argument('-d', '--duration', type=float, default=60.)
+    spectrum_parser.add_argument('-n', '--nperseg', type=int, default=1024)
+    spectrum_parser.add_argument('-o', '--overlap', type=float, default=0.5)
+    spectrum_parser.add_argument('-b', '--block_segments', type=int, nargs='+', default=[1, 4, 16])
+
+    schedule_parser = subparsers.add_parser('schedule', help='Per-channel scan schedule rates on a simulated ADC')
+    schedule_parser.add_argument('-c', '--channels', nargs='+', default=['CH0:500', 'CH1:1:8', 'CH2:10', 'CH3'],
+                                 help='Channels as name[:rate[:gain]]')
+    schedule_parser.add_argument('-r', '--drate', type=int, default=1000)
+    schedule_parser.add_argument('-d', '--duration', type=float, default=5.)
+    schedule_parser.add_argument('-o', '--overhead', type=float, default=2e-4)
+
+    realtime_parser = subparsers.add_parser('realtime', help='Loop period and jitter with the real-time settings of the logger')
+    realtime_parser.add_argument('-s', '--settings', nargs='+', choices=list(realtime_settings), default=None)
+    realtime_parser.add_argument('-p', '--period', type=float, default=1e-3)
+    realtime_parser.add_argument('-d', '--duration', type=float, default=10.)
+    realtime_parser.add_argument('-n', '--n_objects', type=int, default=1000000)
+
+    args = vars(parser.parse_args(argv))
+    benchmark = args.pop('benchmark')
+
+    if benchmark == 'writer':
+        bench_writer(**args)
+    elif benchmark == 'hdf5':
+        bench_hdf5(**args)
+    elif benchmark == 'deploy':
+        bench_deploy(**args)
+    elif benchmark == 'trigger':
+        bench_trigger(**args)
+    elif benchmark == 'limits':
+        bench_limits(**args)
+    elif benchmark == 'spectrum':
+        bench_spectrum(**args)
+    elif benchmark == 'schedule':
+        bench_schedule(**args)
+    elif benchmark == 'realtime':
+        bench_realtime(**args)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import sys
+import time
+import json
+import zmq
+import argparse
+
+# Local endpoint on which the data of each RPi is re-published; {rpi} is replaced by the name of the RPi
+BROKER_ADDRESS = 'ipc:///tmp/ps_monitor_{rpi}'
+
+# Local endpoint on which consumers report the last received sequence number per RPi
+BROKER_STATS_ADDRESS = 'ipc:///tmp/ps_monitor_stats'
+
+
+def tcp_addr(ip, port):
+    return 'tcp://%s:%s' % (ip, port)
+
+
+def broker_addr(rpi, address=BROKER_ADDRESS):
+    return address.format(rpi=rpi)
+
+
+class BrokerClient(object):
+    """
+    Subscriber to the data of one or more RPis re-published by the broker. Reports the sequence number of the
+    last received message per RPi to the broker, which derives the queue depth of each consumer from it. Closing
+    the client deregisters it from the broker.
+
+    Parameters
+    ----------
+
+    context: zmq.Context
+        ZMQ context in which the sockets are created
+    rpis: list
+        names of the RPis to receive data from
+    name: str
+        name of the consumer, as shown by the broker
+    address: str
+        local endpoint of the broker with {rpi} placeholder
+    stats_address: str
+        local endpoint of the broker on which consumers report
+    report_interval: float
+        interval in seconds between reports
+    """
+
+    def __init__(self, context, rpis, name, address=BROKER_ADDRESS, stats_address=BROKER_STATS_ADDRESS, report_interval=1.):
+
+        self.name = name
+        self.report_interval = report_interval
+
+        self.socket = context.socket(zmq.SUB)
+        for rpi in rpis:
+            self.socket.connect(broker_addr(rpi, address))
+        self.socket.setsockopt(zmq.SUBSCRIBE, b'')
+
+        # Own context for the reports, so close() can wait for the deregistration to be delivered
+        self._stats_context = zmq.Context()
+        self._stats = self._stats_context.socket(zmq.PUSH)
+        self._stats.setsockopt(zmq.LINGER, 0)
+        self._stats.connect(stats_address)
+
+        self._seq = {}
+        self._last_report = time.time()
+
+    def recv_json(self):
+        data = self.socket.recv_json()
+
+        self._seq[data['meta']['rpi']] = data['meta']['seq']
+
+        now = time.time()
+        if now - self._last_report > self.report_interval:
+            try:
+                self._stats.send_json({'name': self.name, 'seq': self._seq}, zmq.NOBLOCK)
+            except zmq.Again:
+                pass
+            self._last_report = now
+
+        return data
+
+    def close(self):
+        self.socket.close()
+        try:
+            self._stats.send_json({'name': self.name, 'deregister': True}, zmq.NOBLOCK)
+            # Wait at most 1 s for the deregistration to be delivered
+            self._stats.setsockopt(zmq.LINGER, 1000)
+        except zmq.Again:
+            pass
+        self._stats.close()
+        self._stats_context.term()
+
+
+def _is_stalled(consumer_seq, age, seq, stall_timeout):
+    # Consumers which stopped reporting although messages were published since are stalled
+    return age > stall_timeout and any(seq[rpi] > consumer_seq[rpi] for rpi in consumer_seq)
+
+
+def _consumer_status(name, consumer_seq, report_seq, age, seq, stall_timeout):
+    # Queue depth per RPi of a consumer at the time of its last report: broker sequence number at the report minus
+    # the sequence number the consumer received last
+    queued = dict((rpi, report_seq[rpi] - consumer_seq[rpi]) for rpi in consumer_seq)
+    status = '%s: %s' % (name, ', '.join('%i queued (%s)' % (queued[rpi], rpi) for rpi in consumer_seq))
+    if _is_stalled(consumer_seq, age, seq, stall_timeout):
+        status += ' STALLED, last seq %s, %.0f s ago' % ('/'.join(str(consumer_seq[rpi]) for rpi in consumer_seq), age)
+    return status
+
+
+def run_broker(rpis, address=BROKER_ADDRESS, stats_address=BROKER_STATS_ADDRESS, hwm=100000, status_interval=1., stall_timeout=10.,
+               drop_timeout=60.):
+    """
+    Holds exactly one upstream subscription per RPi and re-publishes its data on a local endpoint per RPi,
+    so the load on the RPis does not depend on the number of local consumers. Every message gets the name of
+    the RPi and a sequence number in its meta data. The message rate per RPi and the queue depth per consumer
+    (messages published but not yet received at its last report) is printed every status_interval seconds. Consumers
+    only report while receiving, so a consumer which did not report for stall_timeout seconds while messages were
+    published is shown as stalled, with its last sequence number and the age of its last report. Closed consumers
+    deregister; consumers which are stalled for drop_timeout seconds, e.g. killed ones, are dropped.
+
+    Parameters
+    ----------
+
+    rpis: dict
+        config per RPi name, needs 'ip' and 'port'
+    address: str
+        local endpoint with {rpi} placeholder
+    stats_address: str
+        local endpoint on which BrokerClients report
+    hwm: int
+        send high water mark of the local endpoints
+    status_interval: float
+        interval in seconds between status outputs
+    stall_timeout: float
+        seconds without report after which a consumer with queued messages is shown as stalled
+    drop_timeout: float
+        seconds without report after which a stalled consumer is dropped
+    """
+    context = zmq.Context()
+    poller = zmq.Poller()
+
+    upstream, downstream = {}, {}
+    for rpi in rpis:
+        upstream[rpi] = context.socket(zmq.SUB)
+        upstream[rpi].setsockopt(zmq.SUBSCRIBE, b'')
+        upstream[rpi].connect(tcp_addr(ip=rpis[rpi]['ip'], port=rpis[rpi]['port']))
+        poller.register(upstream[rpi], zmq.POLLIN)
+
+        downstream[rpi] = context.socket(zmq.PUB)
+        downstream[rpi].setsockopt(zmq.SNDHWM, hwm)
+        downstream[rpi].bind(broker_addr(rpi, address))
+
+    stats = context.socket(zmq.PULL)
+    stats.bind(stats_address)
+    poller.register(stats, zmq.POLLIN)
+
+    sockets = dict((upstream[rpi], rpi) for rpi in upstream)
+    seq = dict((rpi, 0) for rpi in rpis)
+    consumers = {}
+
+    n_msgs = dict((rpi, 0) for rpi in rpis)
+    start = time.time()
+
+    try:
+        print('Re-publishing data of {} on {}'.format(', '.join(rpis), broker_addr('<rpi>', address)))
+        while True:
+            for sock, _ in poller.poll(timeout=int(1e3 * status_interval)):
+
+                if sock is stats:
+                    report = stats.recv_json()
+                    if report.get('deregister'):
+                        consumers.pop(report['name'], None)
+                    else:
+                        # Snapshot of the own sequence numbers, against which the queue depth of the report is derived
+                        consumers[report['name']] = (report['seq'], dict((rpi, seq[rpi]) for rpi in report['seq']), time.time())
+                    continue
+
+                rpi = sockets[sock]
+                data = json.loads(sock.recv())
+                seq[rpi] += 1
+                data['meta']['rpi'] = rpi
+                data['meta']['seq'] = seq[rpi]
+                downstream[rpi].send_json(data)
+                n_msgs[rpi] += 1
+
+            # Status about rates and queue depths
+            now = time.time()
+            if now - start > status_interval:
+
+                status = ', '.join('%s: %.2f Hz' % (rpi, n_msgs[rpi] / (now - start)) for rpi in rpis)
+
+                for name in [name for name in consumers if _is_stalled(consumers[name][0], now - consumers[name][2], seq, drop_timeout)]:
+                    del consumers[name]
+                    sys.stdout.write('\rDropped consumer %s, stalled for more than %.0f s\n' % (name, drop_timeout))
+
+                if consumers:
+                    status += '\t' + ', '.join(_consumer_status(name, consumers[name][0], consumers[name][1], now - consumers[name][2], seq,
+                                                                 stall_timeout)
+                                               for name in sorted(consumers))
+                sys.stdout.write('\r' + status)
+                sys.stdout.flush()
+
+                n_msgs = dict((rpi, 0) for rpi in rpis)
+                start = now
+
+    except (KeyboardInterrupt, SystemExit):
+        print('\nStopping broker...')
+
+    for sock in list(upstream.values()) + list(downstream.values()) + [stats]:
+        sock.close()
+    context.term()
+
+
+def main():
+
+    # parse args from command line
+    parser = argparse.ArgumentParser(description='Re-publish the data of all RPis in the config on local endpoints')
+    parser.add_argument('config', help='Main config yaml')
+    args = vars(parser.parse_args())
+
+    from ps_monitor import logger
+    config = logger.load_config(args['config'])
+    broker_config = config.get('broker') or {}
+    run_broker(rpis=config['rpis'], address=broker_config.get('address', BROKER_ADDRESS),
+               stats_address=broker_config.get('stats_address', BROKER_STATS_ADDRESS))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,291 @@
+import os
 import sys
 import zmq
 import time
 import argparse
+import numpy as np
+from ps_monitor.broker import BrokerClient
 
 # Socket to talk to server
 context = zmq.Context()
 socket = context.socket(zmq.SUB)
 socket.setsockopt(zmq.SUBSCRIBE, b'')  # Subscribe to everything
 
+# Output formats of the data receiver
+# 'line' writes every sample as formatted text line (original behaviour)
+# 'txt' collects samples into blocks and writes them as text with a single, vectorized format operation
+# 'h5' collects samples into blocks and appends them to a HDF5 table
+OUTPUT_FORMATS = ('line', 'txt', 'h5')
 
-def recv_data(channels, port, ip, outfile):
+# Policies on when to fsync the output file to disk
+FSYNC_POLICIES = ('never', 'block', 'rotate')
+
+
+def _header(channels):
+    # Info header, identical for all text formats
+    return ('# Date: %s \n' % time.asctime()
+            + '# Timestamp receiver / s\t' + 'Timestamp data / s\t' + ' \t'.join('%s / V' % c for c in channels) + '\n')
+
+
+def _write_line(out, write_data, n_digits=8):
+    # Write a single sample with one format call per value
+    out.write('\t'.join('%.{}f'.format(n_digits) % v for v in write_data) + '\n')
+
+
+class BlockWriter(object):
+    """
+    Collects samples into a preallocated NumPy block and writes the block to disk in bulk.
+    Files are rotated after a number of rows and / or seconds and fsynced according to the fsync policy.
+    Existing files are appended to, like the line output.
+
+    Parameters
+    ----------
+
+    outfile: str
+        path of the output file; if rotation is enabled, an index is appended to the file name
+    channels: list
+        list of strings with names of channels
+    fmt: str
+        output format, either 'txt' or 'h5'
+    block_size: int
+        number of samples collected before writing
+    n_digits: int
+        number of decimal places of the text output
+    rotate_rows: int
+        number of rows after which a new file is opened, None for no row-based rotation
+    rotate_seconds: float
+        number of seconds after which a new file is opened, None for no time-based rotation
+    fsync: str
+        'never', 'block' for fsync after every written block, 'rotate' for fsync when a file is closed
+    flush_seconds: float
+        number of seconds after which a block is written even if not full, so samples do not stay in memory at low
+        rates; None to only write full blocks
+    """
+
+    def __init__(self, outfile, channels, fmt='txt', block_size=1000, n_digits=8, rotate_rows=None, rotate_seconds=None, fsync='rotate',
+                 flush_seconds=1.):
+
+        if fmt not in ('txt', 'h5'):
+            raise ValueError("Unknown block format '{}'. Supported formats are 'txt' and 'h5'".format(fmt))
+
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("Unknown fsync policy '{}'. Supported policies are {}".format(fsync, ', '.join(FSYNC_POLICIES)))
+
+        self.outfile = outfile
+        self.channels = channels
+        self.fmt = fmt
+        self.n_digits = n_digits
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.fsync = fsync
+        self.flush_seconds = flush_seconds
+
+        # Block of samples: receiver timestamp, data timestamp and one column per channel
+        self.block = np.zeros(shape=(block_size, 2 + len(channels)), dtype=np.float64)
+        self.n_block = 0
+
+        # Format of a single text row; a whole block is formatted with one '%' operation on the repeated row format
+        self._row_fmt = '\t'.join(['%.{}f'.format(n_digits)] * self.block.shape[1]) + '\n'
+
+        # Declare data type numpy style of HDF5 output, same as in logger.logger
+        self._data_type = [('timestamp_recv', '<f8'), ('timestamp_data', '<f8')] + [(ch, '<f4') for ch in channels]
+
+        # File handling
+        self._out = None
+        self._data_table = None
+        self._file_index = 0
+        self._file_rows = 0
+        self._file_start = None
+        self._last_write = time.time()
+
+        # Tolerance per channel and heartbeat of a sender in deadband mode, see set_deadband
+        self.deadband = None
+
+        # Statistics
+        self.n_written = 0
+
+        self._open()
+
+    @property
+    def filename(self):
+        if self.rotate_rows is None and self.rotate_seconds is None:
+            return self.outfile
+        base, ext = os.path.splitext(self.outfile)
+        return '%s_%04i%s' % (base, self._file_index, ext)
+
+    def _open(self):
+
+        if self.fmt == 'txt':
+            self._out = open(self.filename, 'a')
+            self._out.write(_header(self.channels))
+        else:
+            import tables as tb
+            self._out = tb.open_file(self.filename, 'a')
+            # Append to the data of an earlier run
+            if '/RPiData/data' in self._out:
+                self._data_table = self._out.root.RPiData.data
+                if self._data_table.dtype != np.dtype(self._data_type):
+                    self._out.close()
+                    raise ValueError("Channels of existing file {} differ from {}".format(self.filename, ', '.join(self.channels)))
+            else:
+                if '/RPiData' not in self._out:
+                    self._out.create_group(self._out.root, "RPiData")
+                self._data_table = self._out.create_table("/RPiData", description=np.dtype(self._data_type), name="data")
+                # Same header info as for the text output
+                self._data_table.attrs.date = time.asctime()
+                self._data_table.attrs.channels = list(self.channels)
+                self._data_table.attrs.units = 'V'
+            self._write_deadband()
+
+        self._file_rows = 0
+        self._file_start = time.time()
+
+    def _write_deadband(self):
+        # Same attributes as written by the logger, see reader.deadband_info
+        if self.deadband is not None and self.fmt == 'h5':
+            tolerance, heartbeat = self.deadband
+            self._data_table.attrs.deadband_tolerance = np.array([tolerance.get(ch, 0.) for ch in self.channels])
+            self._data_table.attrs.deadband_heartbeat = heartbeat if heartbeat is not None else np.nan
+
+    def set_deadband(self, tolerance, heartbeat=None):
+        """Record the tolerance per channel name and the heartbeat of a sender in deadband mode with the h5 output"""
+        self.deadband = (tolerance, heartbeat)
+        self._write_deadband()
+
+    def _fsync(self):
+        self._out.flush()
+        os.fsync(self._out.fileno())
+
+    def _close(self):
+        if self.fsync in ('block', 'rotate'):
+            self._fsync()
+        self._out.close()
+
+    def _rotate(self):
+        self._close()
+        self._file_index += 1
+        self._open()
+
+    def add(self, timestamp_recv, timestamp_data, values):
+        """Add a single sample to the block; the block is written when full, flush_seconds passed or the file is due to rotate"""
+        row = self.block[self.n_block]
+        row[0] = timestamp_recv
+        row[1] = timestamp_data
+        row[2:] = values
+        self.n_block += 1
+
+        if self.n_block == self.block.shape[0]:
+            self.write()
+            return
+
+        now = time.time()
+        if (self.flush_seconds is not None and now - self._last_write >= self.flush_seconds) or \
+                (self.rotate_seconds is not None and now - self._file_start >= self.rotate_seconds):
+            self.write()
+
+    def write(self):
+        """Write the current block to disk"""
+        self._last_write = time.time()
+        if not self.n_block:
+            return
+
+        block = self.block[:self.n_block]
+
+        if self.fmt == 'txt':
+            self._out.write((self._row_fmt * self.n_block) % tuple(block.ravel().tolist()))
+        else:
+            data = np.empty(shape=self.n_block, dtype=self._data_type)
+            for i, name in enumerate(data.dtype.names):
+                data[name] = block[:, i]
+            self._data_table.append(data)
+            self._data_table.flush()
+
+        if self.fsync == 'block':
+            self._fsync()
+
+        self.n_written += self.n_block
+        self._file_rows += self.n_block
+        self.n_block = 0
+
+        # Check whether we need a new file
+        if (self.rotate_rows is not None and self._file_rows >= self.rotate_rows) or \
+                (self.rotate_seconds is not None and time.time() - self._file_start >= self.rotate_seconds):
+            self._rotate()
+
+    def close(self):
+        self.write()
+        self._close()
+
+
+def recv_data(channels, port, ip, outfile, fmt='line', block_size=1000, rotate_rows=None, rotate_seconds=None, fsync='rotate', broker=None,
+              flush_seconds=1.):
+
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format '{}'. Supported formats are {}".format(fmt, ', '.join(OUTPUT_FORMATS)))
 
     # open outfile
-    with open(outfile, 'a') as out:
+    if fmt == 'line':
+        out = open(outfile, 'a')
         # write info header
-        out.write('# Date: %s \n' % time.asctime())
-        out.write('# Timestamp receiver / s\t' + 'Timestamp data / s\t' + ' \t'.join('%s / V' % c for c in channels) + '\n')
+        out.write(_header(channels))
+    else:
+        out = BlockWriter(outfile=outfile, channels=channels, fmt=fmt, block_size=block_size,
+                          rotate_rows=rotate_rows, rotate_seconds=rotate_seconds, fsync=fsync, flush_seconds=flush_seconds)
+
+    sub = socket
 
-        # try-except clause for ending logger
-        try:
-            print("Collecting data from RaspberryPi...")
+    # try-except clause for ending logger
+    try:
+        print("Collecting data from RaspberryPi...")
+        if broker is not None:
+            # receive the data of RPi named broker from the local broker
+            sub = BrokerClient(context, rpis=[broker], name='data_receiver %s' % broker)
+        else:
             # connecting to specified ip address and port
             socket.connect("tcp://%s:%s" % (ip, port))
-            print("START")
-            while True:
-                # receive actual voltage values including timestamp
-                data = socket.recv_json()
+            sub = socket
+        print("START")
+
+        n_samples = 0
+        start = time.time()
+        while True:
+            # receive actual voltage values including timestamp
+            data = sub.recv_json()
+
+            _meta, _data = data['meta'], data['data']
+
+            # Senders in deadband mode leave out unchanged channels; they are written as NaN like in the logger,
+            # see reader.fill_deadband
+            values = [_data.get(ch, float('nan')) for ch in channels]
+
+            # Record the accuracy guarantee, sent with every scan of a sender in deadband mode
+            if fmt != 'line' and out.deadband is None and 'deadband' in _meta:
+                out.set_deadband(_meta['deadband']['tolerance'], _meta['deadband']['heartbeat'])
+
+            # write voltages to file
+            if fmt == 'line':
+                _write_line(out, [time.time(), _meta['timestamp']] + values)
+            else:
+                out.add(time.time(), _meta['timestamp'], values)
 
-                _meta, _data = data['meta'], data['data']
+            n_samples += 1
 
-                write_data = [time.time(), _meta['timestamp']] + [_data[ch] for ch in channels]
+            # User feedback about sustained sample rate every second
+            now = time.time()
+            if now - start > 1:
+                sys.stdout.write('\rReceiving rate: %.2f samples/s' % (n_samples / (now - start)))
+                sys.stdout.flush()
+                n_samples = 0
+                start = now
 
-                # write voltages to file
-                out.write('\t'.join('%.{}f'.format(8) % v for v in write_data) + '\n')
+    # end receiving with KeyboardInterrupt
+    except KeyboardInterrupt:
+        print('\nStopping logger...\nClosing data file...')
 
-        # end receiving with KeyboardInterrupt
-        except KeyboardInterrupt:
-            print('\nStopping logger...\nClosing data file...')
+    finally:
+        out.close()
+        # Deregisters from the broker
+        sub.close()
 
 
 if __name__ == '__main__':
@@ -45,9 +294,21 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--channels', help='Channel names', required=True)
     parser.add_argument('-o', '--outfile', help='Output file', required=True)
-    parser.add_argument('-ip', '--ip_address', help='IP address', required=True)
-    parser.add_argument('-p', '--port', help='Port', required=True)
+    parser.add_argument('-ip', '--ip_address', help='IP address')
+    parser.add_argument('-p', '--port', help='Port')
+    parser.add_argument('--broker', help='Name of the RPi to receive from the local broker instead of IP address and port')
+    parser.add_argument('-f', '--format', help='Output format', choices=OUTPUT_FORMATS, default='line')
+    parser.add_argument('-b', '--block_size', help='Number of samples per written block', type=int, default=1000)
+    parser.add_argument('--rotate_rows', help='Open a new file after this many rows', type=int, default=None)
+    parser.add_argument('--rotate_seconds', help='Open a new file after this many seconds', type=float, default=None)
+    parser.add_argument('--fsync', help='When to fsync the output file', choices=FSYNC_POLICIES, default='rotate')
+    parser.add_argument('--flush_seconds', help='Write incomplete blocks after this many seconds', type=float, default=1.)
     args = vars(parser.parse_args())
 
-    recv_data(channels=args['channels'].split(' '), ip=args['ip_address'], port=args['port'], outfile=args['outfile'])
+    if args['broker'] is None and not (args['ip_address'] and args['port']):
+        parser.error('IP address and port are required if not receiving from the broker')
 
+    recv_data(channels=args['channels'].split(' '), ip=args['ip_address'], port=args['port'], outfile=args['outfile'],
+              fmt=args['format'], block_size=args['block_size'], rotate_rows=args['rotate_rows'],
+              rotate_seconds=args['rotate_seconds'], fsync=args['fsync'], broker=args['broker'],
+              flush_seconds=args['flush_seconds'])
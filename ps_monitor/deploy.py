@@ -0,0 +1,187 @@
+import os
+import time
+import yaml
+import hashlib
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# File on the DAQ PC, next to the main config, in which the content hashes of the files deployed to each RPi are stored
+DEPLOY_MANIFEST = '.ps_monitor_deploy.yaml'
+
+
+def _hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return _hash(f.read())
+
+
+def _host_id(pm, hostname):
+    # Machine id of the RPi, which changes when it is reflashed or replaced, even if it keeps its IP.
+    # Read through the SSH client of the process manager; None if it cannot be read
+    try:
+        _, stdout, _ = pm.client[hostname].exec_command('cat /etc/machine-id')
+        return stdout.read().decode().strip() or None
+    except (AttributeError, KeyError, IOError, OSError):
+        return None
+
+
+def _format_timings(timings):
+    return ', '.join('{} {:.2f} s'.format(k, v) for k, v in timings.items())
+
+
+def load_manifest(manifest_file=DEPLOY_MANIFEST):
+    if not os.path.isfile(manifest_file):
+        return {}
+    with open(manifest_file, 'r') as mf:
+        return yaml.safe_load(mf) or {}
+
+
+def save_manifest(manifest, manifest_file=DEPLOY_MANIFEST):
+    with open(manifest_file, 'w') as mf:
+        yaml.safe_dump(data=manifest, stream=mf)
+
+
+def deploy_rpi(pm, rpi, rpi_config, deployed=None, force=False, config_dir=None, timings=None):
+    """
+    Deploy the logger to a single RPi and start it. Files whose content hash matches the one in
+    *deployed* are not copied again and an already configured server is not configured again.
+    *deployed* only applies to the host with the machine id stored in it; a reflashed or replaced RPi
+    at the same IP, or one whose machine id cannot be read, is fully deployed.
+
+    Parameters
+    ----------
+
+    pm: ProcessManager
+        irrad_control.utils.proc_manager.ProcessManager or an object with the same interface
+    rpi: str
+        name of the RPi
+    rpi_config: dict
+        logger config of the RPi
+    deployed: dict
+        content hashes of the files deployed to this RPi at the last run, from the deploy manifest
+    force: bool
+        whether to configure the server and copy all files regardless of the hashes
+    config_dir: str
+        local directory in which the config yaml of the RPi is created
+    timings: OrderedDict
+        filled with the step durations in seconds, including the one of a failing step; holds the steps done
+        so far if deploying fails
+
+    Returns
+    -------
+    (timings, deployed): OrderedDict of step durations in seconds, dict of deployed content hashes
+    """
+    deployed = {} if force or deployed is None else dict(deployed)
+    config_dir = os.getcwd() if config_dir is None else config_dir
+    hostname = rpi_config['ip']
+    timings = OrderedDict() if timings is None else timings
+
+    def _step(name, func, *args, **kwargs):
+        start = time.time()
+        try:
+            func(*args, **kwargs)
+        finally:
+            timings[name] = time.time() - start
+
+    # Connect
+    _step('connect', pm.connect_to_server, hostname=hostname, username='pi')
+
+    # What was deployed at the last run is only valid on the same host
+    host_id = _host_id(pm, hostname)
+    if host_id is None or deployed.get('host_id') != host_id:
+        deployed = {'host_id': host_id}
+
+    # Configure, only once
+    if not deployed.get('configured'):
+        _step('configure', pm.configure_server, hostname=hostname, branch="development", git_pull=False)
+        deployed['configured'] = True
+
+    # Create config yaml per RPi
+    local_config = os.path.join(config_dir, "{}_config.yaml".format(rpi))
+    with open(local_config, "w") as rpi_config_file:
+        # The name lets query attribute the sessions written on the RPi to it, see logger.logger
+        yaml.safe_dump(data=dict(rpi_config, rpi=rpi), stream=rpi_config_file)
+
+    # Create start script per RPi
+    cmd = 'echo "{}"'.format("source /home/pi/miniconda2/bin/activate; python logger.py %s_config.yaml" % rpi) + ' > ${HOME}/start_logger.sh'
+    cmd_hash = _hash(cmd.encode())
+    if deployed.get('start_logger.sh') != cmd_hash:
+        _step('start_script', pm._exec_cmd, hostname, cmd)
+        deployed['start_logger.sh'] = cmd_hash
+
+    # Copy config_yaml and logger.py to home folder of RPi, if changed
+    for local, remote in ((local_config, "/home/pi/{}_config.yaml".format(rpi)),
+                          (os.path.join(os.path.dirname(__file__), 'logger.py'), "/home/pi/logger.py")):
+        content_hash = _file_hash(local)
+        if deployed.get(remote) != content_hash:
+            _step('copy ' + os.path.basename(remote), pm.copy_to_server, hostname, local, remote)
+            deployed[remote] = content_hash
+
+    _step('start', pm._exec_cmd, hostname, 'nohup bash /home/pi/start_logger.sh &')
+
+    return timings, deployed
+
+
+def deploy(pm, rpis, max_workers=None, force=False, manifest_file=DEPLOY_MANIFEST, config_dir=None):
+    """
+    Deploy the logger to all RPis in parallel using a thread pool. Per-RPi step timings and failures are logged.
+
+    Parameters
+    ----------
+
+    pm: ProcessManager
+        irrad_control.utils.proc_manager.ProcessManager or an object with the same interface
+    rpis: dict
+        logger config per RPi name
+    max_workers: int
+        number of threads; None or 0 for one thread per RPi
+    force: bool
+        whether to configure all servers and copy all files regardless of the deploy manifest
+    manifest_file: str
+        path to the deploy manifest; None to not use a manifest
+    config_dir: str
+        local directory in which the config yamls of the RPis are created
+
+    Returns
+    -------
+    results: dict of RPi name to (timings, exception) tuple; exception is None on success, timings holds the steps
+    done until the failure otherwise
+    """
+    manifest = load_manifest(manifest_file) if manifest_file is not None else {}
+
+    results = {}
+    start = time.time()
+
+    # Step timings per RPi, which are kept if deploying fails
+    timings = dict((rpi, OrderedDict()) for rpi in rpis)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(rpis) or 1) as executor:
+        futures = dict((rpi, executor.submit(deploy_rpi, pm=pm, rpi=rpi, rpi_config=rpis[rpi],
+                                             deployed=manifest.get(rpis[rpi]['ip']), force=force, config_dir=config_dir,
+                                             timings=timings[rpi]))
+                       for rpi in rpis)
+
+        for rpi, future in futures.items():
+            try:
+                _, deployed = future.result()
+                manifest[rpis[rpi]['ip']] = deployed
+                results[rpi] = (timings[rpi], None)
+                logging.info("Deployed {} ({}) in {:.2f} s: {}".format(rpi, rpis[rpi]['ip'], sum(timings[rpi].values()),
+                                                                         _format_timings(timings[rpi])))
+            except Exception as e:
+                # Forget what we know about this RPi, deploy everything next time
+                manifest.pop(rpis[rpi]['ip'], None)
+                results[rpi] = (timings[rpi], e)
+                logging.error("Deploying {} ({}) failed after {:.2f} s: {}; {}".format(rpi, rpis[rpi]['ip'], sum(timings[rpi].values()), e,
+                                                                                    _format_timings(timings[rpi]) or 'no step done'))
+
+    logging.info("Deployed {} of {} RPi(s) in {:.2f} s".format(sum(1 for r in results.values() if r[1] is None), len(rpis), time.time() - start))
+
+    if manifest_file is not None:
+        save_manifest(manifest, manifest_file)
+
+    return results
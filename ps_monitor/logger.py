@@ -1,8 +1,10 @@
 import sys
 import os
+import gc
 sys.path.insert(1, os.getcwd())
 import tables as tb
 import numpy as np
+import math
 import errno
 import shutil
 import time
@@ -34,6 +36,15 @@ ads1256_drates = OrderedDict([(30000, DRATE_30000),
                               (5, DRATE_5),
                               (2.5, DRATE_2_5)])
 
+# ADS1256 settling time in seconds of the first conversion after switching the input multiplexer, per data rate
+ads1256_settling_times = {30000: 0.21e-3, 15000: 0.25e-3, 7500: 0.31e-3, 3750: 0.44e-3, 2000: 0.68e-3, 1000: 1.18e-3,
+                          500: 2.18e-3, 100: 10.18e-3, 60: 16.84e-3, 50: 20.18e-3, 30: 33.51e-3, 25: 40.18e-3,
+                          15: 66.84e-3, 10: 100.18e-3, 5: 200.18e-3, 2.5: 400.18e-3}
+
+
+# Keys of the per-table HDF5 settings which are passed to tables.Filters
+hdf5_filter_keys = ('complib', 'complevel', 'shuffle', 'bitshuffle', 'fletcher32')
+
 
 def load_config(path_to_config_file):
     # Function, which reads the configuration yaml and checks, if all required information is contained for the chosen case.
@@ -135,7 +146,1068 @@ def _create_actual_adc_channels(channels, mode):
     return actual_channels
 
 
-def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None, drate=None, pga_gain=None, rate=None, mode='s', port=None, ip=None):
+class SWMRTable(object):
+    """
+    Append-only table in a SWMRFile, with the parts of the tables.Table interface used by the logger.
+    Appended rows are buffered and written to the resizable dataset on flush, which makes them visible to SWMR readers.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.attrs = dataset.attrs
+        self._rows = []
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    def append(self, rows):
+        self._rows.append(np.array(rows, dtype=self.dataset.dtype))
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows = np.concatenate(self._rows)
+        self._rows = []
+        n = self.dataset.shape[0]
+        self.dataset.resize((n + len(rows),))
+        self.dataset[n:] = rows
+        self.dataset.flush()
+
+
+class SWMRFile(object):
+    """
+    HDF5 data file written with h5py in single-writer/multiple-reader (SWMR) mode, so it can be read while logging.
+    All tables need to be created before start_swmr is called.
+    """
+
+    def __init__(self, filename):
+        import h5py
+        self.filename = filename
+        self.file = h5py.File(filename, 'w', libver='latest')
+        self.file.create_group("RPiData")
+        self.tables = []
+
+    def create_table(self, name, description, table_config=None):
+        table_config = table_config or {}
+
+        kwargs = {}
+        complib = table_config.get('complib', 'zlib' if table_config.get('complevel') else None)
+        if complib is not None:
+            if complib.startswith('blosc'):
+                try:
+                    import hdf5plugin
+                    shuffle = hdf5plugin.Blosc.BITSHUFFLE if table_config.get('bitshuffle') else \
+                        hdf5plugin.Blosc.SHUFFLE if table_config.get('shuffle', True) else hdf5plugin.Blosc.NOSHUFFLE
+                    kwargs.update(hdf5plugin.Blosc(cname=complib.split(':')[-1] if ':' in complib else 'blosclz',
+                                                   clevel=table_config.get('complevel', 5), shuffle=shuffle))
+                except ImportError:
+                    print('hdf5plugin is needed for {} compression of SWMR files. Using zlib instead.'.format(complib))
+                    complib = 'zlib'
+            if complib == 'zlib':
+                kwargs.update(compression='gzip', compression_opts=table_config.get('complevel', 5),
+                              shuffle=table_config.get('shuffle', True))
+            elif not complib.startswith('blosc'):
+                print('{} compression is not available for SWMR files. Writing uncompressed.'.format(complib))
+
+        if table_config.get('fletcher32'):
+            kwargs['fletcher32'] = True
+
+        chunkshape = table_config.get('chunkshape', None)
+        dataset = self.file.create_dataset("/RPiData/" + name, shape=(0,), maxshape=(None,), dtype=np.dtype(description),
+                                           chunks=tuple(chunkshape) if chunkshape is not None else True, **kwargs)
+        table = SWMRTable(dataset)
+        self.tables.append(table)
+        return table
+
+    def start_swmr(self):
+        self.file.swmr_mode = True
+
+    def flush(self):
+        for table in self.tables:
+            table.flush()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def _open_outfile(filename, swmr=False):
+    # Open the output file with the RPiData group, either with PyTables or as SWMRFile
+    if swmr:
+        return SWMRFile(filename)
+
+    out = tb.open_file(filename, 'w')
+    out.create_group(out.root, "RPiData")
+    return out
+
+
+def _create_table(out, name, description, table_config=None):
+    # Create a table in the /RPiData group with compression filters, expected row count and chunkshape from the table config
+    if isinstance(out, SWMRFile):
+        return out.create_table(name=name, description=description, table_config=table_config)
+
+    table_config = table_config or {}
+
+    filters = None
+    if any(k in table_config for k in hdf5_filter_keys):
+        filters = tb.Filters(**dict((k, table_config[k]) for k in hdf5_filter_keys if k in table_config))
+
+    chunkshape = table_config.get('chunkshape', None)
+    if isinstance(chunkshape, list):
+        chunkshape = tuple(chunkshape)
+
+    return out.create_table("/RPiData", description=description, name=name, filters=filters,
+                            expectedrows=table_config.get('expectedrows', 10000), chunkshape=chunkshape)
+
+
+def _quantize(data_buffer, channels, n_digits):
+    # Quantize channel values in place to 2**-bits with enough bits for n_digits decimal places, like tables.utils.quantize.
+    # This zeros the trailing mantissa bits of the float32 values, which makes them compress a lot better with (bit)shuffle
+    scale = 2. ** math.ceil(math.log(10. ** n_digits, 2))
+    for ch in channels:
+        data_buffer[ch] = np.around(data_buffer[ch] * scale) / scale
+
+
+class TriggerEngine(object):
+    """
+    Evaluates per-channel trigger conditions vectorized over blocks of samples. A preallocated ring buffer holds the
+    samples preceding the current block. When a condition fires, the pre- and post-trigger window is captured at full rate.
+
+    Parameters
+    ----------
+
+    channels: list
+        list of strings with names of channels
+    conditions: dict
+        trigger condition(s) per channel name, each a dict with either
+            'threshold' and 'slope' ('rising', 'falling' or 'both'): fires when the threshold is crossed
+            'window' ([low, high]): fires when the value leaves the window
+    pre_samples: int
+        number of samples stored before the trigger sample
+    post_samples: int
+        number of samples stored from the trigger sample on, at least 1
+    block_size: int
+        number of samples evaluated at once
+    """
+
+    def __init__(self, channels, conditions, pre_samples=1000, post_samples=1000, block_size=100):
+
+        self.channels = channels
+        self.pre_samples = int(pre_samples)
+        self.post_samples = max(1, int(post_samples))
+        self.block_size = int(block_size)
+
+        # Current block of samples
+        self._ts = np.zeros(shape=self.block_size, dtype='<f8')
+        self._values = np.zeros(shape=(self.block_size, len(channels)), dtype='<f4')
+        self._n = 0
+
+        # Pre-trigger ring buffer holding the samples before the current block
+        self._ring_ts = np.zeros(shape=self.pre_samples, dtype='<f8')
+        self._ring_values = np.zeros(shape=(self.pre_samples, len(channels)), dtype='<f4')
+        self._ring_pos = 0
+        self._ring_fill = 0
+
+        # Last sample of the previous block, needed to detect crossings at the block start
+        self._last = None
+
+        # Event which still needs post-trigger samples: [info, timestamps, values, number of filled samples]
+        self._event = None
+        self.n_events = 0
+
+        # Statistics on the cost of evaluating the conditions
+        self.eval_time = 0.
+        self.n_evaluated = 0
+
+        self._compile(conditions)
+
+    def _compile(self, conditions):
+        # Turn the conditions into index and limit arrays so all conditions of a kind are checked at once
+        level, window = [], []
+        for ch in conditions:
+            if ch not in self.channels:
+                raise ValueError('Trigger condition for unknown channel %s' % ch)
+            for cond in (conditions[ch] if isinstance(conditions[ch], list) else [conditions[ch]]):
+                if 'window' in cond:
+                    window.append((self.channels.index(ch), float(cond['window'][0]), float(cond['window'][1])))
+                elif 'threshold' in cond:
+                    slope = cond.get('slope', 'both')
+                    if slope not in ('rising', 'falling', 'both'):
+                        raise ValueError('Unknown trigger slope %s. Supported slopes are "rising", "falling" and "both"' % slope)
+                    level.append((self.channels.index(ch), float(cond['threshold']), slope in ('rising', 'both'), slope in ('falling', 'both')))
+                else:
+                    raise ValueError('Trigger condition for channel %s needs a "threshold" or a "window"' % ch)
+
+        self._level_idx = np.array([c[0] for c in level], dtype=int)
+        self._level_thr = np.array([c[1] for c in level], dtype='<f4')
+        self._level_rise = np.array([c[2] for c in level], dtype=bool)
+        self._level_fall = np.array([c[3] for c in level], dtype=bool)
+        self._window_idx = np.array([c[0] for c in window], dtype=int)
+        self._window_low = np.array([c[1] for c in window], dtype='<f4')
+        self._window_high = np.array([c[2] for c in window], dtype='<f4')
+
+        # Channel name and kind of each condition, in order of the evaluated mask columns
+        self._cond_names = [(self.channels[c[0]], 'rising' if c[2] and not c[3] else 'falling' if c[3] and not c[2] else 'level') for c in level]
+        self._cond_names += [(self.channels[c[0]], 'window') for c in window]
+
+    def _evaluate(self, values):
+        # Boolean mask of shape (samples, conditions); values include the previous sample as first row
+        masks = []
+        if len(self._level_idx):
+            prev, cur = values[:-1, self._level_idx], values[1:, self._level_idx]
+            masks.append((self._level_rise & (prev < self._level_thr) & (cur >= self._level_thr))
+                         | (self._level_fall & (prev > self._level_thr) & (cur <= self._level_thr)))
+        if len(self._window_idx):
+            outside = (values[:, self._window_idx] < self._window_low) | (values[:, self._window_idx] > self._window_high)
+            masks.append(outside[1:] & ~outside[:-1])
+        return np.concatenate(masks, axis=1) if masks else np.zeros(shape=(len(values) - 1, 0), dtype=bool)
+
+    def _pre_trigger(self, ts, values, idx):
+        # Samples before index idx of the current block, from the ring buffer and the block itself
+        if not self.pre_samples:
+            return ts[:0], values[:0]
+        order = (np.arange(self._ring_fill) + self._ring_pos - self._ring_fill) % self.pre_samples
+        pre_ts = np.concatenate([self._ring_ts[order], ts[:idx]])
+        pre_values = np.concatenate([self._ring_values[order], values[:idx]])
+        # Not [-pre_samples:], which would keep everything if pre_samples were 0
+        first = max(0, len(pre_ts) - self.pre_samples)
+        return pre_ts[first:], pre_values[first:]
+
+    def _fill_event(self, ts, values, start):
+        # Fill the post-trigger part of the current event from the block, starting at start; returns the next unused index
+        info, ev_ts, ev_values, filled = self._event
+        n = min(len(ev_ts) - filled, len(ts) - start)
+        ev_ts[filled:filled + n] = ts[start:start + n]
+        ev_values[filled:filled + n] = values[start:start + n]
+        self._event[3] += n
+        return start + n
+
+    def add(self, timestamp, values):
+        """Add a single sample; returns the list of completed events once a block has been evaluated"""
+        self._ts[self._n] = timestamp
+        self._values[self._n] = values
+        self._n += 1
+
+        if self._n == self.block_size:
+            return self.process()
+        return []
+
+    def process(self):
+        """
+        Evaluate the current block; returns list of completed events.
+        Each event is a tuple of (info dict, timestamps, values) with info keys
+        'event', 'timestamp_trigger', 'timestamp_detect', 'channel', 'condition' and 'latency'.
+        """
+        n = self._n
+        if not n:
+            return []
+
+        ts, values = self._ts[:n], self._values[:n]
+        completed = []
+
+        eval_start = time.time()
+        mask = self._evaluate(np.concatenate([values[:1] if self._last is None else self._last, values]))
+        self.eval_time += time.time() - eval_start
+        self.n_evaluated += n
+
+        start = 0
+        while start < n:
+            # Samples belonging to an ongoing event are not checked for new triggers
+            if self._event is not None:
+                start = self._fill_event(ts, values, start)
+                if self._event[3] == len(self._event[1]):
+                    completed.append(tuple(self._event[:3]))
+                    self._event = None
+                continue
+
+            fired = np.nonzero(mask[start:].any(axis=1))[0]
+            if not len(fired):
+                break
+
+            idx = start + fired[0]
+            cond = int(np.argmax(mask[idx]))
+            detect = time.time()
+
+            pre_ts, pre_values = self._pre_trigger(ts, values, idx)
+            ev_ts = np.zeros(shape=len(pre_ts) + self.post_samples, dtype='<f8')
+            ev_values = np.zeros(shape=(len(pre_ts) + self.post_samples, len(self.channels)), dtype='<f4')
+            ev_ts[:len(pre_ts)] = pre_ts
+            ev_values[:len(pre_ts)] = pre_values
+
+            info = {'event': self.n_events, 'timestamp_trigger': ts[idx], 'timestamp_detect': detect,
+                    'channel': self._cond_names[cond][0], 'condition': self._cond_names[cond][1], 'latency': detect - ts[idx]}
+            self._event = [info, ev_ts, ev_values, len(pre_ts)]
+            self.n_events += 1
+            start = idx
+
+        # Update pre-trigger ring buffer with the last samples of this block
+        if self.pre_samples:
+            keep = min(n, self.pre_samples)
+            pos = (np.arange(keep) + self._ring_pos) % self.pre_samples
+            self._ring_ts[pos] = ts[-keep:]
+            self._ring_values[pos] = values[-keep:]
+            self._ring_pos = (self._ring_pos + keep) % self.pre_samples
+            self._ring_fill = min(self._ring_fill + keep, self.pre_samples)
+
+        self._last = values[-1:].copy()
+        self._n = 0
+
+        return completed
+
+    def flush(self):
+        """Evaluate the remaining samples and return all events, including a truncated ongoing one"""
+        completed = self.process()
+        if self._event is not None:
+            info, ev_ts, ev_values, filled = self._event
+            completed.append((info, ev_ts[:filled], ev_values[:filled]))
+            self._event = None
+        return completed
+
+
+def _write_event(events_table, event_info_table, channels, event):
+    # Append the samples of a triggered event to the events table and its trigger info to the event_info table
+    info, ts, values = event
+
+    event_data = np.zeros(shape=len(ts), dtype=events_table.dtype)
+    event_data['event'] = info['event']
+    event_data['timestamp_data'] = ts
+    for i, ch in enumerate(channels):
+        event_data[ch] = values[:, i]
+    events_table.append(event_data)
+
+    event_info = np.zeros(shape=1, dtype=event_info_table.dtype)
+    for key in info:
+        event_info[key] = info[key]
+    event_info_table.append(event_info)
+
+    events_table.flush()
+    event_info_table.flush()
+
+
+def _write_spectrum(spectra_table, spectrum_socket, welch, result):
+    # Append a spectrum to the spectra table and publish it, e.g. to the monitor
+    spectra_table.append(welch.to_array(result))
+    spectra_table.flush()
+
+    if spectrum_socket is not None:
+        spectrum_socket.send_json(welch.to_json(result))
+
+
+class Deadband(object):
+    """
+    Change-based logging: a channel's sample is only stored / published if it differs by more than the tolerance
+    from the last stored value of that channel, or if the heartbeat interval has expired. Holding the last stored
+    value reconstructs every channel to within its tolerance.
+
+    Parameters
+    ----------
+
+    channels: list
+        list of strings with names of channels
+    tolerance: float or dict
+        tolerance in V for all channels or per channel name; channels missing in the dict use a tolerance of 0
+    heartbeat: float
+        maximum interval in seconds after which a channel is stored regardless of its change, None for no heartbeat
+    """
+
+    def __init__(self, channels, tolerance, heartbeat=None):
+
+        if isinstance(tolerance, dict):
+            self.tolerance = np.array([tolerance.get(ch, 0.) for ch in channels], dtype=float)
+        else:
+            self.tolerance = np.full(len(channels), float(tolerance))
+
+        self.heartbeat = heartbeat if isinstance(heartbeat, (int, float)) else None
+
+        # Last stored value and its timestamp per channel
+        self._last = np.full(len(channels), np.nan)
+        self._last_time = np.full(len(channels), -np.inf)
+
+    def update(self, timestamp, values):
+        """Returns boolean array of the channels which need to be stored"""
+        values = np.asarray(values, dtype=float)
+
+        # NaN comparison is False, so the first sample of each channel is always stored
+        changed = ~(np.abs(values - self._last) <= self.tolerance)
+        if self.heartbeat is not None:
+            changed |= timestamp - self._last_time >= self.heartbeat
+
+        self._last[changed] = values[changed]
+        self._last_time[changed] = timestamp
+
+        return changed
+
+
+class OffsetRecalibration(object):
+    """
+    Scheduled offset recalibration during the run. The calibration is done in small steps between scans, so the
+    acquisition dead time per step is bounded to a single calibration of the ADC. The new offsets are applied at once,
+    after the last step.
+
+    Parameters
+    ----------
+
+    adc: ADS1256
+        ADC instance, with OFC register set to 0
+    actual_channels: list
+        input multiplexer settings of the channels, as read by read_continue
+    offset_volts: list
+        offsets from the startup calibration per channel
+    interval: float
+        interval in seconds between recalibrations
+    method: str
+        'self': one self offset calibration per PGA gain in use, one per scan, with the ADC inputs shorted internally.
+        The drift of the self offset at its gain since startup is added to the startup offset of every channel. Can be
+        used while the supplies are on.
+        'system': one system offset calibration per scan, channel after channel, like at startup. Needs all inputs at
+        their zero reference
+    gains: list
+        PGA gain per channel at which its offset is calibrated; None to keep the gain of the ADC
+    restart: callable
+        restarts the conversion cycle after each step; None to restart at the first channel
+    """
+
+    def __init__(self, adc, actual_channels, offset_volts, interval, method='self', gains=None, restart=None):
+
+        if method not in ('self', 'system'):
+            raise ValueError('Unknown recalibration method %s. Supported methods are "self" and "system"' % method)
+
+        self.adc = adc
+        self.actual_channels = actual_channels
+        self.interval = interval
+        self.method = method
+        self.gains = gains
+        self.restart = restart
+
+        self.offset_volts = list(offset_volts)
+        self._startup_offset_volts = list(offset_volts)
+
+        # Self offset at startup per gain in use; the internal offset of the ADC depends on the gain
+        self._self_gains = sorted(set(gains)) if gains is not None else [None]
+        self._self_offset = {}
+        self._drift = {}
+        if method == 'self':
+            for gain in self._self_gains:
+                self._self_offset[gain] = self._cal_self_offset(gain)
+            if gains is not None:
+                self._restart()
+
+        # Calibration steps of the ongoing recalibration and the offsets measured so far
+        self._pending = []
+        self._new_offset_volts = None
+        self._next = time.time() + interval
+
+        # Dead time of the last recalibration in total and the longest single step
+        self.dead_time = 0.
+        self.max_step_time = 0.
+        self.n_recalibrations = 0
+
+    def _cal_self_offset(self, gain=None):
+        if gain is not None:
+            self.adc.pga_gain = gain
+        self.adc.cal_self_offset()
+        offset = self.adc.ofc * self.adc.v_per_digit
+        self.adc.ofc = 0
+        return offset
+
+    def _cal_system_offset(self, pin_pair):
+        self.adc.mux = pin_pair
+        self.adc.cal_system_offset()
+        offset = self.adc.ofc * self.adc.v_per_digit
+        self.adc.ofc = 0
+        return offset
+
+    def _restart(self):
+        if self.restart is not None:
+            self.restart()
+        else:
+            # Restart the conversion cycle at the first channel, like read_sequence does
+            self.adc.mux = self.actual_channels[0]
+            self.adc.sync()
+
+    def step(self):
+        """Do the next calibration step, if due. Returns True when a new set of offsets is complete"""
+        if not self._pending:
+            if time.time() < self._next:
+                return False
+            if self.method == 'self':
+                self._pending = [('self', gain) for gain in self._self_gains]
+            else:
+                self._pending = [('system', i) for i in range(len(self.actual_channels))]
+            self._new_offset_volts = list(self.offset_volts)
+            self.dead_time = 0.
+
+        method, arg = self._pending.pop(0)
+
+        step_start = time.time()
+
+        if method == 'self':
+            self._drift[arg] = self._cal_self_offset(arg) - self._self_offset[arg]
+            if not self._pending:
+                self._new_offset_volts = [o + self._drift[self.gains[i] if self.gains is not None else None]
+                                          for i, o in enumerate(self._startup_offset_volts)]
+        else:
+            if self.gains is not None:
+                self.adc.pga_gain = self.gains[arg]
+            self._new_offset_volts[arg] = self._cal_system_offset(self.actual_channels[arg])
+
+        self._restart()
+
+        step_time = time.time() - step_start
+        self.dead_time += step_time
+        self.max_step_time = max(self.max_step_time, step_time)
+
+        if self._pending:
+            return False
+
+        self.offset_volts = self._new_offset_volts
+        self.n_recalibrations += 1
+        self._next = time.time() + self.interval
+        return True
+
+
+class LimitEngine(object):
+    """
+    Per-channel limit checks, precompiled into limit arrays so every scan is checked with a few vectorized comparisons.
+    An alarm is raised when a check starts being violated and when it is cleared again. A violated check is only
+    cleared once the value is back within its limit by the hysteresis, and a change of state is only reported after
+    it persisted for min_duration seconds, so values sitting at a limit do not raise and clear alarms on every scan.
+
+    Parameters
+    ----------
+
+    channels: list
+        list of strings with names of channels
+    channel_limits: dict
+        limits per channel name: 'min' and / or 'max' in V, 'rate' as maximum absolute rate of change in V/s;
+        optionally 'hysteresis' in V for min and max, 'rate_hysteresis' in V/s and 'min_duration' in seconds
+    relations: list
+        cross-channel limits, each a dict with 'channels' ([a, b]) and 'min' and / or 'max' of the difference a - b in V;
+        optionally 'hysteresis' in V and 'min_duration' in seconds
+    hysteresis: float
+        default hysteresis in V of the min and max checks
+    min_duration: float
+        default time in seconds a violation or its clearing has to persist before it is reported
+    """
+
+    def __init__(self, channels, channel_limits=None, relations=None, hysteresis=0., min_duration=0.):
+
+        channel_limits = channel_limits or {}
+        relations = relations or []
+
+        for ch in channel_limits:
+            if ch not in channels:
+                raise ValueError('Limits for unknown channel %s' % ch)
+
+        for rel in relations:
+            rel_channels = rel.get('channels') or []
+            if len(rel_channels) != 2:
+                raise ValueError('Relation needs exactly two channels, got %s' % rel_channels)
+            for ch in rel_channels:
+                if ch not in channels:
+                    raise ValueError('Relation %s-%s with unknown channel %s' % (rel_channels[0], rel_channels[1], ch))
+
+        n = len(channels)
+        ch_limits = [channel_limits.get(ch) or {} for ch in channels]
+        low = np.array([lim.get('min', -np.inf) for lim in ch_limits], dtype=float)
+        high = np.array([lim.get('max', np.inf) for lim in ch_limits], dtype=float)
+        rate = np.array([lim.get('rate', np.inf) for lim in ch_limits], dtype=float)
+        ch_hyst = np.array([lim.get('hysteresis', hysteresis) for lim in ch_limits], dtype=float)
+        rate_hyst = np.array([lim.get('rate_hysteresis', 0.) for lim in ch_limits], dtype=float)
+        ch_duration = np.array([lim.get('min_duration', min_duration) for lim in ch_limits], dtype=float)
+        rel_hyst = np.array([rel.get('hysteresis', hysteresis) for rel in relations], dtype=float)
+        rel_duration = np.array([rel.get('min_duration', min_duration) for rel in relations], dtype=float)
+
+        self._rel_a = np.array([channels.index(rel['channels'][0]) for rel in relations], dtype=int)
+        self._rel_b = np.array([channels.index(rel['channels'][1]) for rel in relations], dtype=int)
+        rel_low = np.array([rel.get('min', -np.inf) for rel in relations], dtype=float)
+        rel_high = np.array([rel.get('max', np.inf) for rel in relations], dtype=float)
+
+        # All checks in one array: channel min, channel max, channel rate, relation min, relation max
+        self._limits = np.concatenate([low, high, rate, rel_low, rel_high])
+        # +1 for upper, -1 for lower limits, so a check is violated if (value - limit) * sign > 0
+        self._sign = np.concatenate([-np.ones(n), np.ones(2 * n), -np.ones(len(relations)), np.ones(len(relations))])
+        self._values = np.zeros(shape=self._limits.shape)
+        self._hysteresis = np.concatenate([ch_hyst, ch_hyst, rate_hyst, rel_hyst, rel_hyst])
+        self._min_duration = np.concatenate([ch_duration, ch_duration, ch_duration, rel_duration, rel_duration])
+
+        rel_names = ['%s-%s' % tuple(rel['channels']) for rel in relations]
+        self._check_names = ['min'] * n + ['max'] * n + ['rate'] * n + ['min'] * len(relations) + ['max'] * len(relations)
+        self._channel_names = list(channels) * 3 + rel_names * 2
+
+        self._n = n
+        self._state = np.zeros(shape=self._limits.shape, dtype=bool)
+        # Start of a state which differs from the reported state, NaN while they agree
+        self._since = np.full(self._limits.shape, np.nan)
+        self._last = None
+        self._last_time = None
+
+        # Statistics
+        self.n_alarms = 0
+        self.max_latency = 0.
+
+    def check(self, timestamp, values):
+        """Returns list of alarm dicts for all checks which changed their state with this scan"""
+        values = np.asarray(values, dtype=float)
+        n = self._n
+
+        v = self._values
+        v[:n] = values
+        v[n:2 * n] = values
+        if self._last is not None and timestamp > self._last_time:
+            v[2 * n:3 * n] = np.abs(values - self._last) / (timestamp - self._last_time)
+        else:
+            v[2 * n:3 * n] = 0
+        n_rel = len(self._rel_a)
+        if n_rel:
+            v[3 * n:3 * n + n_rel] = values[self._rel_a] - values[self._rel_b]
+            v[3 * n + n_rel:] = v[3 * n:3 * n + n_rel]
+
+        self._last = values
+        self._last_time = timestamp
+
+        # Violated checks stay violated until the value is back within the limit by the hysteresis
+        excess = (v - self._limits) * self._sign
+        violated = np.where(self._state, excess > -self._hysteresis, excess > 0)
+
+        differs = violated != self._state
+        self._since[~differs] = np.nan
+        self._since[differs & np.isnan(self._since)] = timestamp
+        changed = differs & (timestamp - self._since >= self._min_duration)
+        if not changed.any():
+            return []
+
+        self._state = self._state ^ changed
+        self._since[changed] = np.nan
+
+        alarms = []
+        for i in np.nonzero(changed)[0]:
+            alarms.append({'timestamp': timestamp, 'check': self._check_names[i], 'channel': self._channel_names[i],
+                           'state': 'violated' if violated[i] else 'cleared', 'value': v[i], 'limit': self._limits[i]})
+        self.n_alarms += len(alarms)
+        return alarms
+
+
+class ScanSchedule(object):
+    """
+    Per-channel scan scheduling: every channel has its own target rate and PGA gain. The targets are compiled into a
+    repeating sequence of input multiplexer settings in which each channel occurs in proportion to its rate, spread
+    evenly over the sequence. The sequence fills the whole conversion budget of the ADC: the time left after the
+    channels with a target rate goes to the channels without, or, if all channels have a target, is shared in
+    proportion to the targets. Consecutive reads of the same channel continue the running conversion instead of
+    switching the multiplexer, which saves the settling time of the digital filter.
+
+    Parameters
+    ----------
+
+    channels: list
+        list of strings with names of channels
+    actual_channels: list
+        input multiplexer settings of the channels
+    drate: int
+        ADS1256 sampling rate
+    pga_gain: int
+        default PGA gain of channels without a gain
+    channel_config: dict
+        'rate' in Hz and 'gain' per channel name; channels without rate get an equal share of the remaining budget
+    overhead: float
+        time in seconds per read on top of the conversion, for SPI transfers and the readout loop
+    gain_overhead: float
+        additional time in seconds per change of the PGA gain
+    scan_time: float
+        time in seconds of the part of the sequence read per scan of the logger
+    max_cycle: float
+        maximum duration in seconds of the sequence; channels slower than 1 / max_cycle are read once per sequence
+    max_slots: int
+        maximum number of reads in the sequence
+    """
+
+    def __init__(self, channels, actual_channels, drate, pga_gain, channel_config=None, overhead=3e-4, gain_overhead=5e-4,
+                 scan_time=0.1, max_cycle=10., max_slots=100000):
+
+        channel_config = channel_config or {}
+
+        for ch in channel_config:
+            if ch not in channels:
+                raise ValueError('Schedule for unknown channel %s' % ch)
+
+        self.channels = channels
+        self.actual_channels = actual_channels
+        self.targets = [(channel_config.get(ch) or {}).get('rate') for ch in channels]
+        self.gains = [(channel_config.get(ch) or {}).get('gain', pga_gain) for ch in channels]
+
+        for ch, gain in zip(channels, self.gains):
+            if gain not in (1, 2, 4, 8, 16, 32, 64):
+                raise ValueError('Invalid gain %s of channel %s. Possible gains are 1, 2, 4, 8, 16, 32, 64' % (gain, ch))
+
+        # Time per read: a fresh conversion after switching the multiplexer needs the settling time of the filter,
+        # a continued conversion of the same channel only one data period
+        self.switch_time = ads1256_settling_times[drate] + overhead
+        self.continue_time = 1. / drate + overhead
+        self.gain_overhead = gain_overhead
+
+        self.sequence = self._compile(max_cycle=max_cycle, max_slots=max_slots)
+        self.cycle_time = self._cost(self.sequence)
+        self.planned_rates = [self.sequence.count(i) / self.cycle_time for i in range(len(channels))]
+        self.block_slots = max(1, int(round(scan_time / self.cycle_time * len(self.sequence))))
+
+        # Settings per read
+        self._next = self.sequence[1:] + self.sequence[:1]
+        self._mux = [actual_channels[i] for i in self._next]
+        self._continued = [n == c for c, n in zip(self.sequence, self._next)]
+        self._gain_change = [self.gains[n] != self.gains[c] for c, n in zip(self.sequence, self._next)]
+
+        # Full-scale calibration and volts per digit per gain, see calibrate
+        self._fsc = {}
+        self._v_per_digit = {}
+        self._pos = 0
+
+        # Last value per channel
+        self.latest = [np.nan] * len(channels)
+
+        # Statistics
+        self.n_samples = np.zeros(len(channels), dtype=int)
+        self._start = None
+
+    def _cost(self, sequence):
+        # Duration of one pass through the sequence
+        cost = 0.
+        for k in range(len(sequence)):
+            nxt = sequence[(k + 1) % len(sequence)]
+            cost += self.continue_time if sequence[k - 1] == sequence[k] else self.switch_time
+            if self.gains[nxt] != self.gains[sequence[k]]:
+                cost += self.gain_overhead
+        return cost
+
+    def _order(self, counts):
+        # Spread the reads of every channel evenly over the sequence; simultaneous reads are ordered by gain
+        slots = [((j + 0.5) / n, self.gains[i], i) for i, n in enumerate(counts) for j in range(n)]
+        return [i for _, _, i in sorted(slots)]
+
+    def _compile(self, max_cycle, max_slots):
+        fixed = [i for i, r in enumerate(self.targets) if r]
+        free = [i for i, r in enumerate(self.targets) if not r]
+
+        # The slowest channel is read once per sequence, within the limits of duration and length of the sequence
+        cycle = 1. / min(self.targets[i] for i in fixed) if fixed else len(self.channels) * self.switch_time
+        cycle = min(cycle, max_cycle, max_slots * self.continue_time)
+
+        def _counts(scale, n_free):
+            counts = [n_free] * len(self.channels)
+            for i in fixed:
+                counts[i] = max(1, int(round(self.targets[i] * cycle * scale)))
+            return counts
+
+        # Channels with target rate at their targets; scaled down if they do not fit into the cycle or, if there are
+        # no other channels, scaled up to fill it. Repeated, since the cost of a sequence depends on how many reads
+        # continue the conversion of the same channel
+        scale = 1.
+        counts = _counts(scale, 1)
+        for _ in range(3):
+            cost = self._cost(self._order(counts))
+            if free and cost <= cycle:
+                break
+            scale *= cycle / cost
+            counts = _counts(scale, 1)
+
+        # Remaining budget to the channels without target rate: largest equal number of reads which fits into the cycle
+        if free:
+            low, high = 1, int(cycle / self.switch_time / len(free)) + 1
+            while low < high:
+                mid = (low + high + 1) // 2
+                if self._cost(self._order(_counts(scale, mid))) <= cycle:
+                    low = mid
+                else:
+                    high = mid - 1
+            counts = _counts(scale, low)
+
+        return self._order(counts)
+
+    def _set_gain(self, adc, gain):
+        adc.pga_gain = gain
+        adc.fsc = self._fsc[gain]
+
+    def calibrate(self, adc):
+        """
+        Self calibration per gain and system offset calibration of every channel at its gain
+
+        Returns
+        -------
+        offset_volts: list of offsets per channel
+        """
+        offset_volts = [0.] * len(self.channels)
+
+        for gain in sorted(set(self.gains)):
+            adc.pga_gain = gain
+            adc.wait_DRDY()
+            adc.cal_self()
+            adc.wait_DRDY()
+            self._fsc[gain] = adc.fsc
+            self._v_per_digit[gain] = adc.v_per_digit
+
+            for i in range(len(self.channels)):
+                if self.gains[i] == gain:
+                    adc.mux = self.actual_channels[i]
+                    adc.cal_system_offset()
+                    offset_volts[i] = adc.ofc * self._v_per_digit[gain]
+
+        adc.ofc = 0
+        self.restart(adc)
+
+        return offset_volts
+
+    def restart(self, adc):
+        """Restart the conversion cycle at the start of the sequence, e.g. after a calibration"""
+        first = self.sequence[0]
+        self._set_gain(adc, self.gains[first])
+        adc.mux = self.actual_channels[first]
+        adc.sync()
+        self._pos = 0
+
+    def read(self, adc, offset_volts):
+        """
+        Read the next block_slots reads of the sequence
+
+        Returns
+        -------
+        (idx, timestamps, volts): channel index, timestamp and offset-corrected value of every read
+        """
+        if self._start is None:
+            self._start = time.time()
+
+        idx = np.empty(self.block_slots, dtype=int)
+        timestamps = np.empty(self.block_slots)
+        volts = np.empty(self.block_slots)
+
+        pos, n_seq = self._pos, len(self.sequence)
+        for k in range(self.block_slots):
+            i = self.sequence[pos]
+
+            if self._continued[pos]:
+                raw = adc.read_async()
+            elif self._gain_change[pos]:
+                # Read the finished conversion before changing the gain for the next channel
+                raw = adc.read_async()
+                self._set_gain(adc, self.gains[self._next[pos]])
+                adc.mux = self._mux[pos]
+                adc.sync()
+            else:
+                raw = adc.read_and_next_is(self._mux[pos])
+
+            idx[k] = i
+            timestamps[k] = time.time()
+            volts[k] = raw * self._v_per_digit[self.gains[i]] - offset_volts[i]
+
+            pos = pos + 1 if pos + 1 < n_seq else 0
+
+        self._pos = pos
+
+        for i, v in zip(idx, volts):
+            self.latest[i] = v
+        self.n_samples += np.bincount(idx, minlength=len(self.channels))
+
+        return idx, timestamps, volts
+
+    def achieved_rates(self):
+        """Sample rate per channel since the first read"""
+        if self._start is None:
+            return [0.] * len(self.channels)
+        return list(self.n_samples / max(time.time() - self._start, 1e-9))
+
+    def rates_string(self):
+        """Achieved and target (planned for channels without target) rate per channel"""
+        return ', '.join('%s %.2f/%.2f Hz' % (ch, achieved, target if target else planned) for ch, achieved, target, planned
+                         in zip(self.channels, self.achieved_rates(), self.targets, self.planned_rates))
+
+
+class RealtimeTuning(object):
+    """
+    Settings of the acquisition process against jitter from OS scheduling and garbage collection. Settings which cannot
+    be applied, e.g. for missing permissions, are skipped; the error is kept in errors and the setting is not applied.
+
+    Parameters
+    ----------
+
+    cpu: int
+        CPU core to pin the acquisition thread to; None to not pin
+    priority: int
+        SCHED_FIFO real-time priority (1-99) of the acquisition thread; None to keep the normal scheduling.
+        Needs root or CAP_SYS_NICE; should be combined with cpu, so the other cores stay available to the system
+    nice: int
+        nice level of the process, negative levels need root; None to keep the nice level
+    gc: str
+        'enabled' to keep the cyclic garbage collector as it is, 'freeze' to move all objects created during the setup
+        out of the collected generations (Python >= 3.7), 'disable' to freeze and disable the collector in the loop and
+        only collect every gc_interval seconds, outside of the readout
+    gc_interval: float
+        interval in seconds between controlled collections, if gc is 'disable'
+    """
+
+    def __init__(self, cpu=None, priority=None, nice=None, gc='enabled', gc_interval=10.):
+
+        if gc not in ('enabled', 'freeze', 'disable'):
+            raise ValueError('Unknown gc mode %s. Supported modes are "enabled", "freeze" and "disable"' % gc)
+
+        self.cpu = cpu
+        self.priority = priority
+        self.nice = nice
+        self.gc = gc
+        self.gc_interval = gc_interval
+
+        # Settings which were actually applied
+        self.applied = {'cpu': -1, 'priority': 0, 'nice': os.nice(0), 'gc': 'enabled'}
+        self.errors = []
+
+        # Statistics of the controlled collections
+        self.n_collections = 0
+        self.max_collect_time = 0.
+        self._next_collect = None
+
+    def _libc(self):
+        # Linux C library for the scheduling calls missing in the os module of Python 2
+        import ctypes
+        import ctypes.util
+        return ctypes, ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+    def _set_affinity(self, cpu):
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, [cpu])
+            return
+        ctypes, libc = self._libc()
+        mask = ctypes.c_ulong(1 << cpu)
+        if libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def _set_sched_fifo(self, priority):
+        if hasattr(os, 'sched_setscheduler'):
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            return
+        ctypes, libc = self._libc()
+        # struct sched_param only holds the priority; SCHED_FIFO is 1 on Linux
+        param = ctypes.c_int(priority)
+        if libc.sched_setscheduler(0, 1, ctypes.byref(param)) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def _try(self, name, func, *args):
+        try:
+            func(*args)
+            return True
+        except (OSError, AttributeError, ValueError) as e:
+            self.errors.append('%s: %s' % (name, e))
+            return False
+
+    def apply(self):
+        """Apply the scheduling settings to the calling thread and process"""
+        if self.cpu is not None and self._try('cpu', self._set_affinity, self.cpu):
+            self.applied['cpu'] = self.cpu
+
+        if self.priority is not None and self._try('priority', self._set_sched_fifo, self.priority):
+            self.applied['priority'] = self.priority
+
+        if self.nice is not None and self._try('nice', os.nice, self.nice - os.nice(0)):
+            self.applied['nice'] = os.nice(0)
+
+        # Python < 3.7 cannot freeze; disabling works nevertheless
+        if self.gc != 'enabled' and not hasattr(gc, 'freeze'):
+            self.errors.append('gc: freeze needs Python >= 3.7')
+        self.applied['gc'] = self.gc if self.gc == 'disable' or hasattr(gc, 'freeze') else 'enabled'
+
+        for error in self.errors:
+            print('Real-time setting not applied, %s' % error)
+
+    def start(self):
+        """Set up the garbage collector, right before the acquisition loop"""
+        if self.applied['gc'] == 'enabled':
+            return
+
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        if self.applied['gc'] == 'disable':
+            gc.disable()
+            self._next_collect = time.time() + self.gc_interval
+
+    def collect(self):
+        """Controlled collection, if due; call once per loop, outside of the readout"""
+        if self._next_collect is None or time.time() < self._next_collect:
+            return
+
+        collect_start = time.time()
+        gc.collect()
+        self.max_collect_time = max(self.max_collect_time, time.time() - collect_start)
+        self.n_collections += 1
+        self._next_collect = time.time() + self.gc_interval
+
+    def stop(self):
+        if self.applied['gc'] == 'disable':
+            gc.enable()
+        if self.applied['gc'] != 'enabled' and hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+
+
+class LoopTimer(object):
+    """
+    Histograms of the loop period and of the cycle-to-cycle jitter (difference of consecutive periods), in logarithmic
+    bins with bins_per_decade bins from 1 us to 100 s
+
+    Parameters
+    ----------
+
+    bins_per_decade: int
+        number of bins per decade
+    """
+
+    def __init__(self, bins_per_decade=20):
+        self.bins_per_decade = bins_per_decade
+        self.edges = 10 ** (np.arange(8 * bins_per_decade + 1) / float(bins_per_decade) - 6)
+        self.period = np.zeros(len(self.edges) - 1, dtype=np.uint64)
+        self.jitter = np.zeros(len(self.edges) - 1, dtype=np.uint64)
+        self.max_period = 0.
+        self._last = None
+        self._last_period = None
+
+    def _bin(self, value):
+        if value <= 1e-6:
+            return 0
+        return min(int((math.log10(value) + 6) * self.bins_per_decade), len(self.period) - 1)
+
+    def tick(self, timestamp):
+        """Call once per loop with the time of the loop start"""
+        if self._last is not None:
+            period = timestamp - self._last
+            self.period[self._bin(period)] += 1
+            self.max_period = max(self.max_period, period)
+            if self._last_period is not None:
+                self.jitter[self._bin(abs(period - self._last_period))] += 1
+            self._last_period = period
+        self._last = timestamp
+
+    def percentile(self, q, hist=None):
+        """Upper bin edge below which q percent of the entries of a histogram (default the period) are"""
+        hist = self.period if hist is None else hist
+        total = hist.sum()
+        if not total:
+            return np.nan
+        edge = self.edges[1 + np.searchsorted(np.cumsum(hist), q / 100. * total)]
+        return min(edge, self.max_period) if hist is self.period else edge
+
+    def to_array(self):
+        """Rows of the loop timing table, one per bin"""
+        rows = np.zeros(shape=len(self.period), dtype=[('low', '<f8'), ('high', '<f8'), ('period', '<u8'), ('jitter', '<u8')])
+        rows['low'] = self.edges[:-1]
+        rows['high'] = self.edges[1:]
+        rows['period'] = self.period
+        rows['jitter'] = self.jitter
+        return rows
+
+
+def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None, drate=None, pga_gain=None, rate=None, mode='s', port=None, ip=None,
+           hdf5=None, trigger=None, deadband=None, swmr=False, broker=None, recalibration=None, limits=None, spectrum=None,
+           schedule=None, realtime=None, rpi=None):
     """
     Method to log the data read back from a ADS1256 ADC to a file.
     Default is to read from positive AD0-AD7 pins from 0 to 7 for single-
@@ -159,7 +1231,8 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
     outfile: str
         string of output file location
     rate: int
-        Logging rate in Hz, if None go crazy fast
+        Logging rate in Hz, if None go crazy fast. If a trigger is configured, the ADC is read at full speed and only
+        the continuous logging and sending is done at this rate
     drate: int
         ADS1256 sampling rate
     pga_gain: int
@@ -172,6 +1245,51 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
         whether or not to show the data every second on the stdout
     port:
         ZMQ port on which data is published/received via TCP protocol
+    hdf5: dict
+        HDF5 settings per table name ('data', 'meta'): tables.Filters arguments ('complib', 'complevel', 'shuffle',
+        'bitshuffle', 'fletcher32'), 'expectedrows' and 'chunkshape'. If 'quantize' is True for the 'data' table,
+        channel values are quantized to n_digits decimal places before writing to improve compression; this only
+        changes values for n_digits <= 6, float32 values of a few V are not finer than that
+    trigger: dict
+        full-rate transient capture, see TriggerEngine: 'conditions' per channel, 'pre_samples', 'post_samples' and
+        'block_size'. Captured events are written to the 'events' and 'event_info' tables
+    deadband: dict
+        change-based logging, see Deadband: 'tolerance' in V (float or per channel) and 'heartbeat' in seconds.
+        Channels which did not change are written as NaN and not sent; scans without any change are skipped entirely.
+        Tolerances and heartbeat are written to the meta table and as 'deadband_tolerance' and 'deadband_heartbeat'
+        attributes of the data table, also for 'rw', and sent in the 'deadband' meta of every scan.
+        Use reader.fill_deadband to reconstruct the step-wise series
+    swmr: bool
+        write the data file with h5py in single-writer/multiple-reader mode, so it can be read while logging,
+        see reader.read_new and reader.follow. Data becomes visible to readers every second
+    broker: dict
+        only for 'rw': receive the data from the local broker (see broker.run_broker) instead of from the RPi.
+        'rpi' is the name of the RPi, optional 'address' and 'stats_address' are the local broker endpoints
+    recalibration: dict
+        offset recalibration during the run, see OffsetRecalibration: 'interval' in seconds and 'method' ('self' or
+        'system'). Every new set of offsets is appended to the meta table with its timestamp and the dead time; see
+        reader.offsets_at for the offsets per time segment
+    limits: dict
+        limit checks on every scan, see LimitEngine: 'channels' with limits per channel, 'relations' for cross-channel
+        limits, default 'hysteresis' and 'min_duration' and 'port' of the separate ZMQ socket on which alarms are
+        published. Alarms are written to the 'alarms' table
+    spectrum: dict
+        only for 'rw': streaming ripple and noise spectra of the received data, see spectrum.WelchPSD: 'nperseg',
+        'overlap', 'interval' in seconds, 'bands' in Hz, 'fs' and 'max_gap'. Spectra are written to the 'spectra' table
+        and, if 'port' is given, published for the monitor. Not computed if the sender uses deadband
+    schedule: dict
+        per-channel scan scheduling, see ScanSchedule: 'channels' with 'rate' in Hz and 'gain' per channel, 'overhead'
+        and 'gain_overhead' per read in seconds and 'scan_time' in seconds per scan. Every read is written with its own
+        timestamp to the 'stream_<channel>' table of the channel. The data table, sending, trigger, deadband and limits
+        get one scan per scan_time with the last value of every channel. rate then only limits logging and sending
+    realtime: dict
+        only with the ADC: real-time settings of the acquisition, see RealtimeTuning: 'cpu', 'priority' (SCHED_FIFO),
+        'nice', 'gc' ('enabled', 'freeze' or 'disable') and 'gc_interval'. Settings which cannot be applied are skipped;
+        the applied settings and the errors are written to the meta table. Histograms of the loop period and jitter,
+        see LoopTimer, are written to the 'loop_timing' table at the end; an empty dict only records the histograms
+    rpi: str
+        name of the RPi in the main config; set in the RPi config by deploy, so the sessions written on the RPi
+        are attributed to it by query via the used config
 
     Returns
     -------
@@ -195,7 +1313,7 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
                     raise
 
         # Open required file
-        out = tb.open_file(os.path.join(full_path, 'data.h5' if fname is None else fname), 'w')
+        out = _open_outfile(os.path.join(full_path, 'data.h5' if fname is None else fname), swmr=swmr)
 
         # Declare data type numpy style of incoming data
         data_type = [('timestamp_recv', '<f8'), ('timestamp_data', '<f8')] + [(ch, '<f4') for ch in channels]
@@ -203,11 +1321,21 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
         # Create buffer for incoming data
         data_buffer = np.zeros(shape=1, dtype=data_type)
 
-        # Create Group
-        out.create_group(out.root, "RPiData")
+        # HDF5 settings per table
+        hdf5 = hdf5 or {}
+        quantize = hdf5.get('data', {}).get('quantize', False)
 
         # Make table
-        data_table = out.create_table("/RPiData", description=data_buffer.dtype, name="data")
+        data_table = _create_table(out, name="data", description=data_buffer.dtype, table_config=hdf5.get('data'))
+
+        if quantize:
+            data_table.attrs['least_significant_digit'] = n_digits
+
+        # Accuracy guarantee of the deadband mode, also in 'rw' files which have no meta table, see reader.fill_deadband
+        if deadband:
+            tolerance = Deadband(channels=channels, tolerance=deadband.get('tolerance', 0.), heartbeat=deadband.get('heartbeat'))
+            data_table.attrs['deadband_tolerance'] = tolerance.tolerance
+            data_table.attrs['deadband_heartbeat'] = tolerance.heartbeat if tolerance.heartbeat is not None else np.nan
 
         #if log_type == 'rw':
         #    # write info header
@@ -226,14 +1354,47 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
 
         # Fire up ZMQ stuff
         ctx = zmq.Context()
-        socket = ctx.socket(zmq.PUB if log_type != 'rw' else zmq.SUB)
 
-        # Make distinctions between socket types
-        if socket.socket_type == zmq.PUB:
-            socket.bind("tcp://*:{}".format(port))
+        # Receive the data of this RPi from the local broker instead of from the RPi itself
+        if log_type == 'rw' and broker:
+            from ps_monitor.broker import BrokerClient, BROKER_ADDRESS, BROKER_STATS_ADDRESS
+            socket = BrokerClient(ctx, rpis=[broker['rpi']], name='logger ' + broker['rpi'],
+                                  address=broker.get('address', BROKER_ADDRESS),
+                                  stats_address=broker.get('stats_address', BROKER_STATS_ADDRESS))
+
         else:
-            socket.setsockopt(zmq.SUBSCRIBE, '')  # Connect to all available data
-            socket.connect("tcp://%s:%s" % (ip, port))
+            socket = ctx.socket(zmq.PUB if log_type != 'rw' else zmq.SUB)
+
+            # Make distinctions between socket types
+            if socket.socket_type == zmq.PUB:
+                socket.bind("tcp://*:{}".format(port))
+            else:
+                socket.setsockopt(zmq.SUBSCRIBE, '')  # Connect to all available data
+                socket.connect("tcp://%s:%s" % (ip, port))
+
+    # Ripple and noise spectra of the received data
+    welch = None
+    # A sender in deadband mode leaves out unchanged scans, so its data is not uniformly sampled
+    if log_type == 'rw' and spectrum and deadband:
+        print("Spectra need uniformly sampled data, which a sender in deadband mode does not send. No spectra are computed!")
+    elif log_type == 'rw' and spectrum:
+        from ps_monitor.spectrum import WelchPSD
+        welch = WelchPSD(channels=channels, nperseg=spectrum.get('nperseg', 1024), overlap=spectrum.get('overlap', 0.5),
+                         interval=spectrum.get('interval', 10.), bands=spectrum.get('bands'), fs=spectrum.get('fs'),
+                         block_segments=spectrum.get('block_segments', 4), max_gap=spectrum.get('max_gap', 3.))
+
+        spectra_table = _create_table(out, name="spectra", description=welch.dtype, table_config=hdf5.get('spectra'))
+        # Frequencies of a spectrum are np.arange(nperseg // 2 + 1) * fs / nperseg
+        spectra_table.attrs['nperseg'] = welch.nperseg
+        spectra_table.attrs['overlap'] = spectrum.get('overlap', 0.5)
+        spectra_table.attrs['max_gap'] = welch.max_gap
+        spectra_table.attrs['bands'] = [band for band, _ in welch.bands]
+        spectra_table.attrs['band_limits'] = np.array([f for _, f in welch.bands], dtype=np.float64).reshape(-1, 2)
+
+        spectrum_socket = None
+        if spectrum.get('port'):
+            spectrum_socket = ctx.socket(zmq.PUB)
+            spectrum_socket.bind("tcp://*:{}".format(spectrum['port']))
 
     # We're using the ADC
     if log_type in ('s', 'sw', 'w'):
@@ -265,35 +1426,161 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
 
         actual_channels = _create_actual_adc_channels(channels, mode)
 
-        # Get the offset voltages for every pin pair we're using here
-        offset_volts = []
-        for pin_pair in actual_channels:
-            adc.mux = pin_pair
-            adc.cal_system_offset()
-            bit_offset = adc.ofc
-            offset_volts.append(bit_offset * adc.v_per_digit)
+        # Per-channel rates and gains
+        scan_schedule = None
+        if schedule:
+            scan_schedule = ScanSchedule(channels=channels, actual_channels=actual_channels, drate=drate, pga_gain=pga_gain,
+                                         channel_config=schedule.get('channels'), overhead=schedule.get('overhead', 3e-4),
+                                         gain_overhead=schedule.get('gain_overhead', 5e-4), scan_time=schedule.get('scan_time', 0.1))
 
-        # Set this to 0 since we want to manually calc the offset for each channel
-        adc.ofc = 0
+            print('Scan schedule of %i reads in %.3f s: %s' % (len(scan_schedule.sequence), scan_schedule.cycle_time,
+                                                               ', '.join('%s %.2f Hz (gain %i)' % (ch, r, g) for ch, r, g in
+                                                                         zip(channels, scan_schedule.planned_rates, scan_schedule.gains))))
+
+            # Offsets of every channel at its gain
+            offset_volts = scan_schedule.calibrate(adc)
+
+        else:
+            # Get the offset voltages for every pin pair we're using here
+            offset_volts = []
+            for pin_pair in actual_channels:
+                adc.mux = pin_pair
+                adc.cal_system_offset()
+                bit_offset = adc.ofc
+                offset_volts.append(bit_offset * adc.v_per_digit)
+
+            # Set this to 0 since we want to manually calc the offset for each channel
+            adc.ofc = 0
+
+        # Offset recalibration during the run
+        offset_recalibration = None
+        if recalibration:
+            offset_recalibration = OffsetRecalibration(adc=adc, actual_channels=actual_channels, offset_volts=offset_volts,
+                                                       interval=recalibration.get('interval', 600),
+                                                       method=recalibration.get('method', 'self'),
+                                                       gains=scan_schedule.gains if scan_schedule is not None else None,
+                                                       restart=(lambda: scan_schedule.restart(adc)) if scan_schedule is not None else None)
+
+        # Real-time settings of the acquisition and histograms of the loop timing
+        realtime_tuning = loop_timer = None
+        if realtime is not None:
+            realtime_tuning = RealtimeTuning(cpu=realtime.get('cpu'), priority=realtime.get('priority'), nice=realtime.get('nice'),
+                                             gc=realtime.get('gc', 'enabled'), gc_interval=realtime.get('gc_interval', 10.))
+            realtime_tuning.apply()
+            loop_timer = LoopTimer(bins_per_decade=realtime.get('bins_per_decade', 20))
+
+        # Change-based logging
+        deadband_filter = None
+        if deadband:
+            deadband_filter = Deadband(channels=channels, tolerance=deadband.get('tolerance', 0.), heartbeat=deadband.get('heartbeat'))
+            # Sent with every scan, so receivers can record the accuracy guarantee
+            deadband_meta = {'tolerance': dict(zip(channels, deadband_filter.tolerance.tolist())), 'heartbeat': deadband_filter.heartbeat}
 
         # We're writing to file
         if log_type != 's':
             # Declare data type numpy style of incoming data
             meta_type = [('pga_gain', '<i2'), ('drate', '<f4')] + [(ch + "_offset", '<f4') for ch in channels]
 
+            # Offsets are valid from the timestamp on
+            if recalibration:
+                meta_type += [('timestamp', '<f8'), ('dead_time', '<f4')]
+
+            # Gain, target rate and planned rate per channel
+            if schedule:
+                meta_type += [(ch + "_gain", '<i2') for ch in channels] + [(ch + "_target_rate", '<f4') for ch in channels] \
+                             + [(ch + "_planned_rate", '<f4') for ch in channels]
+
+            # Applied real-time settings and why the others were not applied
+            if realtime is not None:
+                meta_type += [('cpu', '<i2'), ('sched_priority', '<i2'), ('nice', '<i2'), ('gc', 'S8'), ('realtime_errors', 'S256')]
+
+            # Record the accuracy guarantee of the deadband mode
+            if deadband:
+                meta_type += [('heartbeat', '<f4')] + [(ch + "_deadband", '<f4') for ch in channels]
+
             # Create buffer for incoming data
             meta_buffer = np.zeros(shape=1, dtype=meta_type)
 
-            meta_table = out.create_table("/RPiData", description=meta_buffer.dtype, name="meta")
+            meta_table = _create_table(out, name="meta", description=meta_buffer.dtype, table_config=hdf5.get('meta'))
 
             meta_buffer["pga_gain"] = pga_gain
             meta_buffer["drate"] = drate
             for i, ch in enumerate(channels):
                 meta_buffer[ch + "_offset"] = offset_volts[i]
 
+            if recalibration:
+                meta_buffer["timestamp"] = time.time()
+
+            if schedule:
+                for i, ch in enumerate(channels):
+                    meta_buffer[ch + "_gain"] = scan_schedule.gains[i]
+                    meta_buffer[ch + "_target_rate"] = scan_schedule.targets[i] or np.nan
+                    meta_buffer[ch + "_planned_rate"] = scan_schedule.planned_rates[i]
+
+            if realtime is not None:
+                meta_buffer["cpu"] = realtime_tuning.applied['cpu']
+                meta_buffer["sched_priority"] = realtime_tuning.applied['priority']
+                meta_buffer["nice"] = realtime_tuning.applied['nice']
+                meta_buffer["gc"] = realtime_tuning.applied['gc']
+                meta_buffer["realtime_errors"] = '; '.join(realtime_tuning.errors)[:256]
+
+            if deadband:
+                meta_buffer["heartbeat"] = deadband_filter.heartbeat if deadband_filter.heartbeat is not None else np.nan
+                for i, ch in enumerate(channels):
+                    meta_buffer[ch + "_deadband"] = deadband_filter.tolerance[i]
+
             meta_table.append(meta_buffer)
             meta_table.flush()
 
+        # Limit checks with dedicated alarm socket
+        limit_engine = None
+        if limits:
+            limit_engine = LimitEngine(channels=channels, channel_limits=limits.get('channels'), relations=limits.get('relations'),
+                                       hysteresis=limits.get('hysteresis', 0.), min_duration=limits.get('min_duration', 0.))
+
+            alarm_socket = None
+            if limits.get('port'):
+                alarm_ctx = zmq.Context()
+                alarm_socket = alarm_ctx.socket(zmq.PUB)
+                # Do not block the shutdown on alarms which cannot be delivered
+                alarm_socket.setsockopt(zmq.LINGER, 1000)
+                alarm_socket.bind("tcp://*:{}".format(limits['port']))
+
+            if log_type != 's':
+                alarm_type = [('timestamp', '<f8'), ('check', 'S8'), ('channel', 'S64'), ('state', 'S8'),
+                              ('value', '<f4'), ('limit', '<f4'), ('latency', '<f4')]
+                alarm_table = _create_table(out, name="alarms", description=np.dtype(alarm_type), table_config=hdf5.get('alarms'))
+
+        # Transient capture
+        trigger_engine = None
+        if trigger:
+            trigger_engine = TriggerEngine(channels=channels, conditions=trigger['conditions'],
+                                           pre_samples=trigger.get('pre_samples', 1000),
+                                           post_samples=trigger.get('post_samples', 1000),
+                                           block_size=trigger.get('block_size', 100))
+
+            if log_type == 's':
+                print('Trigger is configured but no data is written. Events will not be stored.')
+            else:
+                events_type = [('event', '<u4'), ('timestamp_data', '<f8')] + [(ch, '<f4') for ch in channels]
+                events_table = _create_table(out, name="events", description=np.dtype(events_type), table_config=hdf5.get('events'))
+
+                event_info_type = [('event', '<u4'), ('timestamp_trigger', '<f8'), ('timestamp_detect', '<f8'),
+                                   ('channel', 'S32'), ('condition', 'S8'), ('latency', '<f4')]
+                event_info_table = _create_table(out, name="event_info", description=np.dtype(event_info_type), table_config=hdf5.get('event_info'))
+
+        # Every read of the scan schedule with its own timestamp, one table per channel
+        if scan_schedule is not None and log_type != 's':
+            stream_tables = [_create_table(out, name="stream_" + ch, description=np.dtype([('timestamp_data', '<f8'), (ch, '<f4')]),
+                                           table_config=hdf5.get('stream_' + ch)) for ch in channels]
+
+        # Time of the last logged scan, if the ADC is read at full speed and only logged at the given rate
+        last_logged = 0
+
+        if loop_timer is not None and log_type != 's':
+            loop_timing_table = _create_table(out, name="loop_timing", description=loop_timer.to_array().dtype,
+                                              table_config=hdf5.get('loop_timing'))
+
     # save a copy of the used main_config.yaml file in the data path
     if not os.path.exists(full_path):
         try:
@@ -304,12 +1591,24 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
                 raise
     shutil.copyfile(sys.argv[-1], os.path.join(full_path, "used_config.yaml"))
 
+    # All tables are created, readers may open the file from here on
+    if swmr and 'w' in log_type:
+        out.start_swmr()
+
+    # Garbage collector settings right before the loop, when all objects of the setup exist
+    if log_type != 'rw' and realtime_tuning is not None:
+        realtime_tuning.start()
+
     # try -except clause for ending logger
     try:
         print('Start logging channel(s) {} to file {}. Press CTRL + C to stop.'.format(', '.join(channels), full_path))
         start = time.time()
+        last_data = {}
         while True:
 
+            # whether the current sample goes into the continuous data
+            log_sample = True
+
             # get current channels
             if log_type == 'rw':
                 readout_start = time.time()
@@ -320,37 +1619,122 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
 
                 data_buffer["timestamp_recv"] = time.time()
                 data_buffer["timestamp_data"] = _meta['timestamp']
-                for ch in _data:
-                    data_buffer[ch] = _data[ch]
+                # Channels missing in the data were not sent by a deadband logger and are stored as NaN, like on the sender
+                for ch in channels:
+                    data_buffer[ch] = _data.get(ch, np.nan)
+
+                # Last received value per channel for display
+                last_data.update(_data)
+
+                if welch is not None:
+                    for result in welch.add(_meta['timestamp'], [data_buffer[ch][0] for ch in channels]):
+                        _write_spectrum(spectra_table, spectrum_socket, welch, result)
 
                 readout_end = time.time()
             else:
 
-                readout_start = time.time()
+                if loop_timer is not None:
+                    loop_timer.tick(time.time())
 
-                raw = adc.read_continue(actual_channels)
-                volts = [b * adc.v_per_digit for b in raw]
+                # Recalibrate offsets in small steps between scans; the new offsets apply from the next scan on
+                if offset_recalibration is not None and offset_recalibration.step():
+                    offset_volts = offset_recalibration.offset_volts
 
-                # TODO: offset seems to be subtracted already in adc.cal_system_offset() in line 133 -> temporarily inserted factor 0.
-                actual_volts = [volts[i] - offset_volts[i] for i in range(len(volts))]
+                    if log_type != 's':
+                        meta_buffer["timestamp"] = time.time()
+                        meta_buffer["dead_time"] = offset_recalibration.dead_time
+                        for i, ch in enumerate(channels):
+                            meta_buffer[ch + "_offset"] = offset_volts[i]
+                        meta_table.append(meta_buffer)
+                        meta_table.flush()
 
-                data_buffer["timestamp_data"] = readout_start
-                for i, ch in enumerate(channels):
-                    data_buffer[ch] = actual_volts[i]
+                readout_start = time.time()
+
+                if scan_schedule is not None:
+                    stream_idx, stream_ts, stream_volts = scan_schedule.read(adc, offset_volts)
+                    actual_volts = list(scan_schedule.latest)
+                else:
+                    raw = adc.read_continue(actual_channels)
+                    volts = [b * adc.v_per_digit for b in raw]
+
+                    # TODO: offset seems to be subtracted already in adc.cal_system_offset() in line 133 -> temporarily inserted factor 0.
+                    actual_volts = [volts[i] - offset_volts[i] for i in range(len(volts))]
 
                 readout_end = time.time()
 
+                if scan_schedule is not None and log_type != 's':
+                    for i, stream_table in enumerate(stream_tables):
+                        selected = stream_idx == i
+                        if selected.any():
+                            stream_data = np.zeros(shape=selected.sum(), dtype=stream_table.dtype)
+                            stream_data['timestamp_data'] = stream_ts[selected]
+                            stream_data[channels[i]] = stream_volts[selected]
+                            stream_table.append(stream_data)
+
+                # Check limits on every scan and notify right away
+                if limit_engine is not None:
+                    alarms = limit_engine.check(readout_start, actual_volts)
+                    if alarms:
+                        if alarm_socket is not None:
+                            alarm_socket.send_json({'meta': {'timestamp': readout_start}, 'alarms': alarms})
+
+                        # Detection to notification latency
+                        latency = time.time() - readout_start
+                        limit_engine.max_latency = max(limit_engine.max_latency, latency)
+
+                        if log_type != 's':
+                            alarm_data = np.zeros(shape=len(alarms), dtype=alarm_table.dtype)
+                            for i, alarm in enumerate(alarms):
+                                for key in alarm:
+                                    alarm_data[i][key] = alarm[key]
+                            alarm_data['latency'] = latency
+                            alarm_table.append(alarm_data)
+                            alarm_table.flush()
+
+                # Feed every sample to the trigger; continuous data is only logged at the given rate
+                if trigger_engine is not None:
+                    for event in trigger_engine.add(readout_start, actual_volts):
+                        if log_type != 's':
+                            _write_event(events_table, event_info_table, channels, event)
+
+                # Continuous data is only logged at the given rate if the ADC is read at full speed
+                if (trigger_engine is not None or scan_schedule is not None) and isinstance(rate, (int, float)):
+                    log_sample = readout_start - last_logged >= 1. / rate
+                    if log_sample:
+                        last_logged = readout_start
+
+                # Only store and send channels which changed by more than their tolerance
+                changed = None
+                if deadband_filter is not None and log_sample:
+                    changed = deadband_filter.update(readout_start, actual_volts)
+                    log_sample = changed.any()
+
+                if log_sample and 'w' in log_type:
+                    data_buffer["timestamp_data"] = readout_start
+                    for i, ch in enumerate(channels):
+                        data_buffer[ch] = actual_volts[i] if changed is None or changed[i] else np.nan
+
                 # send data to
-                if 's' in log_type:
-                    data = {'meta': {'timestamp': readout_start}, 'data': dict(zip(channels, actual_volts))}
+                if 's' in log_type and log_sample:
+                    if changed is None:
+                        data = {'meta': {'timestamp': readout_start}, 'data': dict(zip(channels, actual_volts))}
+                    else:
+                        data = {'meta': {'timestamp': readout_start, 'deadband': deadband_meta},
+                                'data': dict((ch, actual_volts[i]) for i, ch in enumerate(channels) if changed[i])}
                     socket.send_json(data)
 
+                # Controlled garbage collection on its own timer, after the scan is sent and before the wait
+                if realtime_tuning is not None:
+                    realtime_tuning.collect()
+
                 # wait, if wanted
-                if isinstance(rate, (int, float)):
+                if trigger_engine is None and scan_schedule is None and isinstance(rate, (int, float)):
                     time.sleep(1. / rate)
 
             # write voltages to file
-            if 'w' in log_type:
+            if 'w' in log_type and log_sample:
+                if quantize:
+                    _quantize(data_buffer, channels, n_digits)
                 data_table.append(data_buffer)
 
             # User feedback about logging and readout rates every second
@@ -361,6 +1745,10 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
                 except NameError:
                     pass
 
+                if log_type in ('w', 'sw') and scan_schedule is not None:
+                    for stream_table in stream_tables:
+                        stream_table.flush()
+
                 # actual logging and readout rate
                 logging_rate = 1. / (time.time() - readout_start)
                 readout_rate = 1. / (readout_end - readout_start)
@@ -369,15 +1757,39 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
                 if log_type =='rw':
                     log_string = 'Logging rate: %.2f Hz' % logging_rate + ',\t' + 'Readout rate: %.2f Hz for %i channel(s)'\
                              % (readout_rate, len(channels))
+
+                    if welch is not None:
+                        log_string += ',\tSpectra: %i' % welch.n_spectra
+                        if welch.n_gaps:
+                            log_string += ', gaps: %i' % welch.n_gaps
                 else:
                     log_string = 'Logging rate: %.2f Hz' % logging_rate + ',\t' + 'Readout rate: %.2f Hz for %i channel(s)'\
                              % (readout_rate, len(actual_channels))
 
+                    if scan_schedule is not None:
+                        log_string += ',\tRates: %s' % scan_schedule.rates_string()
+
+                    if loop_timer is not None:
+                        log_string += ',\tLoop period: p99 %.3f ms, max %.3f ms' % (1e3 * loop_timer.percentile(99), 1e3 * loop_timer.max_period)
+                        if realtime_tuning.n_collections:
+                            log_string += ', GC: %i, max %.2f ms' % (realtime_tuning.n_collections, 1e3 * realtime_tuning.max_collect_time)
+
+                    if limit_engine is not None:
+                        log_string += ',\tAlarms: %i, max. latency %.2f ms' % (limit_engine.n_alarms, 1e3 * limit_engine.max_latency)
+
+                    if offset_recalibration is not None:
+                        log_string += ',\tRecalibrations: %i, max. dead time %.2f ms' \
+                                      % (offset_recalibration.n_recalibrations, 1e3 * offset_recalibration.max_step_time)
+
+                    if trigger_engine is not None:
+                        log_string += ',\tTrigger: %i event(s), %.2f us/sample' \
+                                      % (trigger_engine.n_events, 1e6 * trigger_engine.eval_time / max(trigger_engine.n_evaluated, 1))
+
                 # show values
                 if show_data:
                     # print out with flushing
                     if log_type == 'rw':
-                        log_string += ': %s' % ', '.join('{}: %.{}f V'.format(channels[i], n_digits) % _data[k] for i,k in enumerate(channels))
+                        log_string += ': %s' % ', '.join('{}: %.{}f V'.format(channels[i], n_digits) % last_data.get(k, np.nan) for i,k in enumerate(channels))
                     else:
                         log_string += ': %s' % ', '.join('{}: %.{}f V'.format(channels[i], n_digits) % actual_volts[i] for i in range(len(actual_volts)))
 
@@ -389,11 +1801,37 @@ def logger(channels, log_type, n_digits, show_data=False, path=None, fname=None,
                 start = time.time()
 
     except (KeyboardInterrupt, SystemExit):
+        if log_type in ('w', 'sw') and trigger_engine is not None:
+            for event in trigger_engine.flush():
+                _write_event(events_table, event_info_table, channels, event)
+
+        if log_type in ('s', 'w', 'sw') and scan_schedule is not None:
+            print('\nAchieved / target rates: %s' % scan_schedule.rates_string())
+
+        if log_type in ('s', 'w', 'sw') and realtime_tuning is not None:
+            realtime_tuning.stop()
+            print('\nLoop period: p50 %.3f ms, p99 %.3f ms, p99.9 %.3f ms, max %.3f ms; jitter p99 %.3f ms'
+                  % tuple(1e3 * v for v in (loop_timer.percentile(50), loop_timer.percentile(99), loop_timer.percentile(99.9),
+                                            loop_timer.max_period, loop_timer.percentile(99, loop_timer.jitter))))
+            if log_type != 's':
+                loop_timing_table.append(loop_timer.to_array())
+                loop_timing_table.flush()
+
+        if welch is not None:
+            for result in welch.flush():
+                _write_spectrum(spectra_table, spectrum_socket, welch, result)
+            if spectrum_socket is not None:
+                spectrum_socket.close()
+
         if 'w' in log_type:
             print('\nStopping logger...\nClosing %s...' % str(out.filename))
             out.flush()
             out.close()
 
+        if log_type != 'rw' and limit_engine is not None and alarm_socket is not None:
+            alarm_socket.close()
+            alarm_ctx.term()
+
         if 's' in log_type or 'r' in log_type:
             socket.close()
             print('Stopped {} data'.format('sending' if 's' in log_type else 'receiving'))
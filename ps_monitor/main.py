@@ -1,59 +1,68 @@
-import sys
 import os
-import yaml
+import sys
 import logging
 import multiprocessing
-from irrad_control.utils.proc_manager import ProcessManager
-from ps_monitor.monitor import main as DoTheMonitoringThing
-from ps_monitor import logger
+from ps_monitor.deploy import deploy, DEPLOY_MANIFEST
+from ps_monitor.broker import run_broker, BROKER_ADDRESS, BROKER_STATS_ADDRESS
 
 logging.getLogger().setLevel("INFO")
 
 
-def _configure_rpi_server(config, pm):
-
-    # Prepare RPi
-    ip = config["ip"]
-
-    # Connect
-    pm.connect_to_server(hostname=ip, username='pi')
+def main():
 
-    # Configure
-    pm.configure_server(hostname=ip, branch="development", git_pull=False)
+    # Query the recorded sessions instead of running the monitor: ps_monitor query PATH [PATH ...] -c CHANNELS ...
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        from ps_monitor import query
+        query.main(sys.argv[2:])
+        return
 
+    # Benchmark the data path instead of running the monitor: ps_monitor benchmark {writer,hdf5,...} ...
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        from ps_monitor import benchmark
+        benchmark.main(sys.argv[2:])
+        return
 
-def main():
+    # Only needed for running the monitor
+    from irrad_control.utils.proc_manager import ProcessManager
+    from ps_monitor.monitor import main as DoTheMonitoringThing
+    from ps_monitor import logger
 
     path_to_config_file = sys.argv[-1]
     config = logger.load_config(path_to_config_file)
 
     pm = ProcessManager()
 
-    # 1) Configure all RPi s
+    # 1) Configure all RPi s in parallel; unchanged files are not copied again
     for rpi in config['rpis']:
-
         logger.check_config(config['rpis'][rpi])
-        _configure_rpi_server(config=config['rpis'][rpi], pm=pm)
-
-        hostname = config['rpis'][rpi]["ip"]
 
-        # Create config yaml per RPi
-        with open("{}_config.yaml".format(rpi), "w") as rpi_config:
-            yaml.safe_dump(data=config['rpis'][rpi], stream=rpi_config)
+    # The config yamls of the RPis and the deploy manifest are created next to the main config
+    config_dir = os.path.dirname(os.path.abspath(path_to_config_file))
+    deploy_config = config.get('deploy') or {}
+    results = deploy(pm=pm, rpis=config['rpis'], max_workers=deploy_config.get('workers'), force=deploy_config.get('force', False),
+                     manifest_file=os.path.join(config_dir, DEPLOY_MANIFEST), config_dir=config_dir)
 
-        # Create start script per RPi
-        cmd = 'echo "{}"'.format("source /home/pi/miniconda2/bin/activate; python logger.py %s_config.yaml" % rpi) + ' > ${HOME}/start_logger.sh'
-        pm._exec_cmd(hostname, cmd)
+    failed = [rpi for rpi in results if results[rpi][1] is not None]
+    if failed:
+        logging.warning("Not receiving data from {}".format(', '.join(failed)))
+        for rpi in failed:
+            del config['rpis'][rpi]
 
-        # Copy config_yaml and logger.py to home folder of Rpi
-        pm.copy_to_server(hostname, os.path.join(os.getcwd(), "{}_config.yaml".format(rpi)), "/home/pi/{}_config.yaml".format(rpi))
-        pm.copy_to_server(hostname, os.path.join(os.path.dirname(__file__), 'logger.py'), "/home/pi/logger.py")
+    workers = []
 
-        pm._exec_cmd(hostname, 'nohup bash /home/pi/start_logger.sh &')
+    # Single upstream connection per RPi, re-published locally for all receiving processes
+    broker = config.get('broker')
+    if broker:
+        worker = multiprocessing.Process(target=run_broker, kwargs=dict(rpis=config["rpis"],
+                                                                       address=broker.get('address', BROKER_ADDRESS),
+                                                                       stats_address=broker.get('stats_address', BROKER_STATS_ADDRESS)))
+        workers.append(worker)
+        worker.start()
 
-    workers = []
     for rpi in config["rpis"]:
         config["rpis"][rpi]["log_type"] = "rw"
+        if broker:
+            config["rpis"][rpi]["broker"] = dict(broker, rpi=rpi)
         worker = multiprocessing.Process(target=logger.logger, kwargs=config["rpis"][rpi])
         workers.append(worker)
         worker.start()
@@ -61,7 +70,7 @@ def main():
     # Step 1) is done here
     # Step 2: move the logger.py + config + start_script to all RPis
     if config['monitor']:
-        worker = multiprocessing.Process(target=DoTheMonitoringThing, args=(config["rpis"],))
+        worker = multiprocessing.Process(target=DoTheMonitoringThing, args=(config["rpis"], broker))
         workers.append(worker)
         worker.start()
 
@@ -1,9 +1,11 @@
 import sys
 import zmq
 import time
+import pyqtgraph as pg
 from PyQt5 import QtCore, QtWidgets, QtGui
 from threading import Event
 from ps_monitor import logger
+from ps_monitor.broker import BrokerClient, BROKER_ADDRESS, BROKER_STATS_ADDRESS
 
 # Package imports
 from irrad_control.utils.worker import QtWorker as Worker
@@ -19,11 +21,15 @@ def tcp_addr(ip, port):
 class PSMonitorWin(QtWidgets.QMainWindow):
 
     data_received = QtCore.pyqtSignal(dict)
+    spectrum_received = QtCore.pyqtSignal(dict)
     print(data_received, 'data received')
 
-    def __init__(self, config, parent=None):
+    def __init__(self, config, broker=None, parent=None):
         super(PSMonitorWin, self).__init__(parent)
 
+        # Broker config, if data is received from the local broker instead of from the RPis
+        self.broker = broker
+
         self.stop_recv_data = Event()
 
         # ZMQ context; THIS IS THREADSAFE! SOCKETS ARE NOT!
@@ -37,6 +43,8 @@ class PSMonitorWin(QtWidgets.QMainWindow):
         self.port = {}
         self.ip = {}
         self.channels = []
+        # Ports on which the receiving loggers publish spectra, see logger.logger spectrum
+        self.spectrum_port = {}
 
         # Create worker to listen to data stream
 
@@ -47,6 +55,10 @@ class PSMonitorWin(QtWidgets.QMainWindow):
         worker = Worker(self.recv_data)
         self.threadpool.start(worker)
 
+        if self.spectrum_port:
+            worker = Worker(self.recv_spectra)
+            self.threadpool.start(worker)
+
     def _setup_config(self):
         # Do amazing with config dict
 
@@ -56,6 +68,10 @@ class PSMonitorWin(QtWidgets.QMainWindow):
             self.ip[rpi] = self.config[rpi]["ip"]
             self.channels += self.config[rpi]["channels"]
 
+            spectrum = self.config[rpi].get("spectrum")
+            if spectrum and spectrum.get("port"):
+                self.spectrum_port[rpi] = spectrum["port"]
+
     def _init_ui(self):
 
         # Main window settings
@@ -73,18 +89,51 @@ class PSMonitorWin(QtWidgets.QMainWindow):
         self.data_received.connect(lambda data: plot.set_data(meta=data['meta'], data=data['data']))
 
         monitor_widget = PlotWrapperWidget(plot)
-        self.setCentralWidget(monitor_widget)
 
-    def recv_data(self):
+        if not self.spectrum_port:
+            self.setCentralWidget(monitor_widget)
+            return
 
-        # Data subscriber
-        data_sub = self.context.socket(zmq.SUB)
+        # Ripple and noise spectra of all channels below the time series
+        spectrum_plot = pg.PlotWidget(title='Noise spectral density')
+        spectrum_plot.setLogMode(x=True, y=True)
+        spectrum_plot.setLabel('bottom', 'Frequency', units='Hz')
+        spectrum_plot.setLabel('left', 'Noise density / V/sqrt(Hz)')
+        spectrum_plot.showGrid(x=True, y=True)
+        spectrum_plot.addLegend()
 
-        # Connect to interpreter data stream
-        for rpi in self.config:
-            data_sub.connect(tcp_addr(ip=self.ip[rpi], port=self.port[rpi]))
+        curves = {}
+        for i, ch in enumerate(self.channels):
+            curves[ch] = spectrum_plot.plot(name=ch, pen=pg.intColor(i, hues=len(self.channels)))
+
+        def _set_spectrum(spectrum):
+            # Leave out the DC bin, which cannot be shown in log scale
+            for ch in spectrum['psd']:
+                if ch in curves:
+                    curves[ch].setData(spectrum['frequencies'][1:], [p ** 0.5 for p in spectrum['psd'][ch][1:]])
+
+        self.spectrum_received.connect(_set_spectrum)
 
-        data_sub.setsockopt(zmq.SUBSCRIBE, b'')
+        splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
+        splitter.addWidget(monitor_widget)
+        splitter.addWidget(spectrum_plot)
+        self.setCentralWidget(splitter)
+
+    def recv_data(self):
+
+        # Data subscriber
+        if self.broker is not None:
+            data_sub = BrokerClient(self.context, rpis=list(self.config), name='monitor',
+                                    address=self.broker.get('address', BROKER_ADDRESS),
+                                    stats_address=self.broker.get('stats_address', BROKER_STATS_ADDRESS))
+        else:
+            data_sub = self.context.socket(zmq.SUB)
+
+            # Connect to interpreter data stream
+            for rpi in self.config:
+                data_sub.connect(tcp_addr(ip=self.ip[rpi], port=self.port[rpi]))
+
+            data_sub.setsockopt(zmq.SUBSCRIBE, b'')
         data_timestamp = None
 
         while not self.stop_recv_data.is_set():
@@ -103,6 +152,18 @@ class PSMonitorWin(QtWidgets.QMainWindow):
             self.data_received.emit(data)
         data_sub.close()
 
+    def recv_spectra(self):
+
+        # Spectra are published by the receiving loggers on this PC
+        spectrum_sub = self.context.socket(zmq.SUB)
+        for rpi in self.spectrum_port:
+            spectrum_sub.connect(tcp_addr(ip='localhost', port=self.spectrum_port[rpi]))
+        spectrum_sub.setsockopt(zmq.SUBSCRIBE, b'')
+
+        while not self.stop_recv_data.is_set():
+            self.spectrum_received.emit(spectrum_sub.recv_json())
+        spectrum_sub.close()
+
     def close(self):
 
         self.context.close()
@@ -110,12 +171,12 @@ class PSMonitorWin(QtWidgets.QMainWindow):
         super(self, PSMonitorWin).close()
 
 
-def main(config):
+def main(config, broker=None):
     app = QtWidgets.QApplication(sys.argv)
     font = QtGui.QFont()
     font.setPointSize(11)
     app.setFont(font)
-    psm = PSMonitorWin(config=config)
+    psm = PSMonitorWin(config=config, broker=broker)
     psm.show()
     app.exec_()
 
@@ -125,4 +186,4 @@ if __name__ == '__main__':
 
     path_to_config_file = sys.argv[-1]
     config = logger.load_config(path_to_config_file)
-    sys.exit(main(config=config["rpis"]))
+    sys.exit(main(config=config["rpis"], broker=config.get("broker")))
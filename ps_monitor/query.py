@@ -0,0 +1,323 @@
+import os
+import re
+import time
+import yaml
+import argparse
+import numpy as np
+import tables as tb
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from ps_monitor import reader
+
+# File in each data root in which the session catalog is stored
+CATALOG_FILE = '.ps_monitor_catalog.yaml'
+
+# Name of the data file and of the copied config within each session directory path/Y-m-d/H-M-S
+DATA_FILE = 'data.h5'
+CONFIG_FILE = 'used_config.yaml'
+
+# Aggregates available per channel
+AGGREGATES = ('n', 'mean', 'std', 'min', 'max')
+
+
+def parse_time(value, now=None):
+    """
+    Parse a point in time given as 'now', relative to now ('30m', '12h', '7d', '2w') or as
+    'Y-m-d', 'Y-m-d H:M' or 'Y-m-d H:M:S'. Returns a unix timestamp
+    """
+    now = time.time() if now is None else now
+
+    if value == 'now':
+        return now
+
+    relative = re.match(r'^(\d+(?:\.\d+)?)([smhdw])$', value)
+    if relative:
+        return now - float(relative.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}[relative.group(2)]
+
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(datetime.strptime(value, fmt).timetuple())
+        except ValueError:
+            pass
+
+    raise ValueError('Cannot parse time {}'.format(value))
+
+
+def _rpi_name(config, channels):
+    # Name and IP of the RPi of a session from its used config: a main config lists all RPis, an RPi config has its IP
+    # and, if written by deploy, its name. The name of an RPi config without name is resolved from its IP in query
+    if config is None:
+        return None, None
+    if 'rpis' in config:
+        for rpi in config['rpis']:
+            rpi_channels = config['rpis'][rpi].get('channels', [])
+            rpi_channels = rpi_channels if isinstance(rpi_channels, list) else rpi_channels.split()
+            if rpi_channels == channels:
+                return rpi, config['rpis'][rpi].get('ip')
+        return None, None
+    return config.get('rpi'), config.get('ip')
+
+
+def rpi_names(main_configs):
+    """IP to RPi name mapping of the given main config files"""
+    names = {}
+    for path in main_configs:
+        with open(path, 'r') as conf_file:
+            config = yaml.safe_load(conf_file) or {}
+        for rpi in config.get('rpis') or {}:
+            if config['rpis'][rpi].get('ip'):
+                names[config['rpis'][rpi]['ip']] = rpi
+    return names
+
+
+def scan_session(path):
+    """
+    Catalog entry of a single session from its data file and used config
+
+    Parameters
+    ----------
+
+    path: str
+        path to the data.h5 file of the session
+
+    Returns
+    -------
+    dict with 'start', 'stop' (data timestamps), 'rows', 'channels', 'rpi', 'ip', 'drate', 'pga_gain', 'mtime' and 'size'
+    """
+    stat = os.stat(path)
+    n_rows, first, last = reader.table_info(path, 'data')
+
+    channels = [name for name in first.dtype.names if not name.startswith('timestamp')] if first is not None else []
+
+    config = None
+    config_path = os.path.join(os.path.dirname(path), CONFIG_FILE)
+    if os.path.isfile(config_path):
+        with open(config_path, 'r') as conf_file:
+            try:
+                config = yaml.safe_load(conf_file)
+            except yaml.YAMLError:
+                pass
+
+    rpi, ip = _rpi_name(config, channels)
+
+    # Settings of the ADC from the meta table, if written on the RPi, else from the config
+    drate = pga_gain = None
+    try:
+        _, meta, _ = reader.table_info(path, 'meta')
+        if meta is not None:
+            drate, pga_gain = float(meta['drate']), int(meta['pga_gain'])
+    except (KeyError, tb.NoSuchNodeError):
+        rpi_config = config['rpis'].get(rpi, {}) if config is not None and 'rpis' in config else config or {}
+        drate, pga_gain = rpi_config.get('drate'), rpi_config.get('pga_gain')
+
+    return {'start': float(first['timestamp_data']) if first is not None else None,
+            'stop': float(last['timestamp_data']) if last is not None else None,
+            'rows': int(n_rows), 'channels': channels, 'rpi': rpi, 'ip': ip, 'drate': drate, 'pga_gain': pga_gain,
+            'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def update_catalog(root, executor=None):
+    """
+    Update the session catalog of a data root incrementally: only sessions whose data file is new or changed
+    (modification time or size) are scanned, sessions whose data file is gone are removed.
+
+    Parameters
+    ----------
+
+    root: str
+        data root, as 'path' in the logger config, with sessions in root/Y-m-d/H-M-S
+    executor: concurrent.futures.Executor
+        executor to scan the sessions in parallel; None to scan sequentially
+
+    Returns
+    -------
+    catalog: dict of data file path relative to root to catalog entry
+    """
+    catalog_file = os.path.join(root, CATALOG_FILE)
+
+    catalog = {}
+    if os.path.isfile(catalog_file):
+        with open(catalog_file, 'r') as cf:
+            catalog = yaml.safe_load(cf) or {}
+
+    found = {}
+    for dirpath, _, filenames in os.walk(root):
+        if DATA_FILE in filenames:
+            path = os.path.join(dirpath, DATA_FILE)
+            found[os.path.relpath(path, root)] = os.stat(path)
+
+    # Sessions which are new or changed since the last scan, or cataloged without IP by an older version
+    to_scan = [rel for rel, stat in found.items()
+               if rel not in catalog or catalog[rel]['mtime'] != stat.st_mtime or catalog[rel]['size'] != stat.st_size
+               or 'ip' not in catalog[rel]]
+
+    paths = [os.path.join(root, rel) for rel in to_scan]
+    results = executor.map(_scan_session, paths) if executor is not None else map(_scan_session, paths)
+
+    for rel, entry in zip(to_scan, results):
+        if entry is not None:
+            catalog[rel] = entry
+
+    for rel in [rel for rel in catalog if rel not in found]:
+        del catalog[rel]
+
+    with open(catalog_file, 'w') as cf:
+        yaml.safe_dump(data=catalog, stream=cf)
+
+    return catalog
+
+
+def _scan_session(path):
+    # Files which cannot be read (e.g. just created) are left out of the catalog and scanned again next time
+    try:
+        return scan_session(path)
+    except (IOError, OSError, KeyError, AttributeError, tb.HDF5ExtError, tb.NoSuchNodeError):
+        return None
+
+
+def aggregate_session(path, channels, start=None, stop=None, chunk_size=100000):
+    """
+    Per-channel count, sum, sum of squares, minimum and maximum of a session within a time range, streaming the
+    data file in chunks. NaN values (channels not stored in deadband mode) are ignored.
+
+    Returns
+    -------
+    dict of channel name to dict with 'n', 'sum', 'sum2', 'min' and 'max'
+    """
+    partial = dict((ch, {'n': 0, 'sum': 0., 'sum2': 0., 'min': np.inf, 'max': -np.inf}) for ch in channels)
+
+    for chunk in reader.iter_chunks(path, 'data', chunk_size=chunk_size):
+
+        selected = np.ones(len(chunk), dtype=bool)
+        if start is not None:
+            selected &= chunk['timestamp_data'] >= start
+        if stop is not None:
+            selected &= chunk['timestamp_data'] <= stop
+        if not selected.any():
+            continue
+
+        for ch in channels:
+            values = chunk[ch][selected].astype(np.float64)
+            values = values[~np.isnan(values)]
+            if not len(values):
+                continue
+            p = partial[ch]
+            p['n'] += len(values)
+            p['sum'] += values.sum()
+            p['sum2'] += np.square(values).sum()
+            p['min'] = min(p['min'], values.min())
+            p['max'] = max(p['max'], values.max())
+
+    return partial
+
+
+def _aggregate_session(kwargs):
+    return aggregate_session(**kwargs)
+
+
+def query(roots, channels, start=None, stop=None, rpi=None, workers=None, chunk_size=100000, names=None):
+    """
+    Per-channel aggregates over all sessions in the data roots. The session catalog of each root is updated first;
+    sessions outside the time range or without the channels are pruned, the others are aggregated in parallel.
+    Sessions written on an RPi without its name in the used config are attributed to the RPi by their IP, using
+    *names* and the main configs of the sessions written on the DAQ PC.
+
+    Parameters
+    ----------
+
+    roots: list
+        data roots, as 'path' in the logger config
+    channels: list
+        list of strings with names of channels
+    start, stop: float
+        unix timestamps of the time range; None for no bound
+    rpi: str
+        only sessions of this RPi, given by name or IP
+    workers: int
+        number of processes; None for the number of CPUs
+    chunk_size: int
+        number of rows read at once
+    names: dict
+        IP to RPi name, see rpi_names
+
+    Returns
+    -------
+    (results, n_sessions): dict of channel name to dict of aggregates, number of aggregated sessions
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        catalogs = [(root, update_catalog(root, executor=executor)) for root in roots]
+
+        # Resolve the name of RPis known only by IP
+        ip_names = dict((entry['ip'], entry['rpi']) for _, catalog in catalogs for entry in catalog.values()
+                        if entry.get('rpi') and entry.get('ip'))
+        ip_names.update(names or {})
+
+        sessions = []
+        for root, catalog in catalogs:
+            for rel, entry in catalog.items():
+                if entry['start'] is None:
+                    continue
+                if start is not None and entry['stop'] < start:
+                    continue
+                if stop is not None and entry['start'] > stop:
+                    continue
+                if rpi is not None and rpi not in (entry['rpi'] or ip_names.get(entry.get('ip')), entry.get('ip')):
+                    continue
+                session_channels = [ch for ch in channels if ch in entry['channels']]
+                if session_channels:
+                    sessions.append({'path': os.path.join(root, rel), 'channels': session_channels,
+                                     'start': start, 'stop': stop, 'chunk_size': chunk_size})
+
+        partials = list(executor.map(_aggregate_session, sessions))
+
+    results = {}
+    for ch in channels:
+        n = sum(p[ch]['n'] for p in partials if ch in p)
+        if not n:
+            results[ch] = dict((agg, np.nan) for agg in AGGREGATES)
+            results[ch]['n'] = 0
+            continue
+        total = sum(p[ch]['sum'] for p in partials if ch in p)
+        total2 = sum(p[ch]['sum2'] for p in partials if ch in p)
+        mean = total / n
+        results[ch] = {'n': n, 'mean': mean, 'std': np.sqrt(max(total2 / n - mean ** 2, 0.)),
+                       'min': min(p[ch]['min'] for p in partials if ch in p),
+                       'max': max(p[ch]['max'] for p in partials if ch in p)}
+
+    return results, len(sessions)
+
+
+def main(argv=None):
+
+    # parse args from command line
+    parser = argparse.ArgumentParser(prog='ps_monitor query',
+                                     description='Per-channel aggregates over all sessions in the given data paths')
+    parser.add_argument('paths', nargs='+', help='Data paths, as path in the logger config')
+    parser.add_argument('-c', '--channels', nargs='+', required=True, help='Channel names')
+    parser.add_argument('-s', '--since', default=None, help="Start of the time range: 'Y-m-d[ H:M[:S]]' or relative, e.g. '7d', '12h'")
+    parser.add_argument('-u', '--until', default=None, help="End of the time range, same format as --since or 'now'")
+    parser.add_argument('-r', '--rpi', default=None, help='Only sessions of this RPi, by name or IP')
+    parser.add_argument('--config', nargs='+', default=[], help='Main config(s) to resolve RPi names from IPs')
+    parser.add_argument('-a', '--aggregates', nargs='+', choices=AGGREGATES, default=list(AGGREGATES))
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of processes')
+    parser.add_argument('--chunk_size', type=int, default=100000, help='Number of rows read at once')
+    args = vars(parser.parse_args(argv))
+
+    query_start = time.time()
+    results, n_sessions = query(roots=args['paths'], channels=args['channels'],
+                                start=parse_time(args['since']) if args['since'] else None,
+                                stop=parse_time(args['until']) if args['until'] else None,
+                                rpi=args['rpi'], workers=args['workers'], chunk_size=args['chunk_size'],
+                                names=rpi_names(args['config']))
+
+    print('%i session(s) in %.2f s' % (n_sessions, time.time() - query_start))
+    print('%-16s' % 'channel' + ''.join('%16s' % agg for agg in args['aggregates']))
+    for ch in args['channels']:
+        print('%-16s' % ch + ''.join('%16i' % results[ch][agg] if agg == 'n' else '%16.8f' % results[ch][agg]
+                                     for agg in args['aggregates']))
+
+
+if __name__ == '__main__':
+    main()
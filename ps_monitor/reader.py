@@ -0,0 +1,315 @@
+import time
+import numpy as np
+import tables as tb
+
+
+def fill_deadband(data, channels=None):
+    """
+    Reconstruct the step-wise series of data written in deadband mode: every NaN channel value is replaced by the
+    last stored value of that channel. The result is within the channel's tolerance, stored in the meta table and in
+    the 'deadband_tolerance' attribute of the data table, see deadband_info. Values before the first stored value of
+    a channel stay NaN.
+
+    Parameters
+    ----------
+
+    data: np.ndarray
+        structured array of the data table
+    channels: list
+        list of strings with names of channels to fill; None for all float32 columns
+
+    Returns
+    -------
+    filled copy of data
+    """
+    data = data.copy()
+    channels = channels or [name for name in data.dtype.names if data.dtype[name] == np.float32]
+
+    for ch in channels:
+        values = data[ch]
+        # Index of the last stored value for every row
+        idx = np.where(np.isnan(values), 0, np.arange(len(values)))
+        np.maximum.accumulate(idx, out=idx)
+        data[ch] = values[idx]
+
+    return data
+
+
+def deadband_info(path):
+    """
+    Tolerance per channel and heartbeat of a file written in deadband mode, by the logger on the RPi or on the
+    receiving side, or by the data receiver
+
+    Returns
+    -------
+    (tolerance, heartbeat): dict of channel name to tolerance in V, heartbeat in seconds (NaN for none);
+    (None, None) if the file was not written in deadband mode
+    """
+    f, table = _open_table(path, 'data')
+    try:
+        if isinstance(f, tb.File):
+            attrs = dict((name, table.attrs[name]) for name in table.attrs._v_attrnames)
+        else:
+            attrs = dict(table.attrs)
+        # Tolerances are stored in the order of the channel columns
+        channels = [name for name in table.dtype.names if not name.startswith('timestamp')]
+    finally:
+        f.close()
+
+    if 'deadband_tolerance' not in attrs:
+        return None, None
+
+    return dict(zip(channels, [float(t) for t in attrs['deadband_tolerance']])), float(attrs['deadband_heartbeat'])
+
+
+def offsets_at(meta, timestamps, channels, interpolate=False):
+    """
+    Offsets of the channels at the given timestamps, from the meta table of a logger with offset recalibration.
+    Every meta row holds the offsets valid from its timestamp on until the next row.
+
+    Parameters
+    ----------
+
+    meta: np.ndarray
+        structured array of the meta table
+    timestamps: np.ndarray
+        timestamps at which the offsets are needed, usually data['timestamp_data']
+    channels: list
+        list of strings with names of channels
+    interpolate: bool
+        whether to interpolate linearly between the calibrations instead of using the offsets of the time segment
+
+    Returns
+    -------
+    offsets: np.ndarray of shape (len(timestamps), len(channels))
+    """
+    offsets = np.zeros(shape=(len(timestamps), len(channels)))
+
+    # Files without recalibration have a single set of offsets
+    if 'timestamp' not in meta.dtype.names:
+        for i, ch in enumerate(channels):
+            offsets[:, i] = meta[ch + '_offset'][0]
+        return offsets
+
+    if interpolate:
+        for i, ch in enumerate(channels):
+            offsets[:, i] = np.interp(timestamps, meta['timestamp'], meta[ch + '_offset'])
+    else:
+        segment = np.clip(np.searchsorted(meta['timestamp'], timestamps, side='right') - 1, 0, len(meta) - 1)
+        for i, ch in enumerate(channels):
+            offsets[:, i] = meta[ch + '_offset'][segment]
+
+    return offsets
+
+
+def reapply_offsets(data, meta, channels=None):
+    """
+    Replace the offsets subtracted by the logger, which are constant within each time segment between two
+    recalibrations, by offsets interpolated linearly between the recalibrations. This removes the steps in the
+    data at each recalibration caused by offset drift.
+
+    Parameters
+    ----------
+
+    data: np.ndarray
+        structured array of the data table
+    meta: np.ndarray
+        structured array of the meta table
+    channels: list
+        list of strings with names of channels; None for all channels with an offset in the meta table
+
+    Returns
+    -------
+    corrected copy of data
+    """
+    data = data.copy()
+    channels = channels or [name[:-len('_offset')] for name in meta.dtype.names if name.endswith('_offset')]
+
+    applied = offsets_at(meta, data['timestamp_data'], channels)
+    interpolated = offsets_at(meta, data['timestamp_data'], channels, interpolate=True)
+
+    for i, ch in enumerate(channels):
+        data[ch] += applied[:, i] - interpolated[:, i]
+
+    return data
+
+
+def load_data(path, fill=True):
+    """
+    Read the data and meta table of a ps_monitor data file
+
+    Parameters
+    ----------
+
+    path: str
+        path to the data.h5 file
+    fill: bool
+        whether to reconstruct channels written in deadband mode, see fill_deadband
+
+    Returns
+    -------
+    (data, meta): structured arrays of the data and meta table; meta is None if the file has no meta table
+    """
+    try:
+        with tb.open_file(path, 'r') as f:
+            data = f.root.RPiData.data[:]
+            meta = f.root.RPiData.meta[:] if '/RPiData/meta' in f else None
+    # Files written in SWMR mode use the latest HDF5 file format, which PyTables built against an older HDF5 cannot read
+    except (tb.HDF5ExtError, tb.NoSuchNodeError):
+        import h5py
+        with h5py.File(path, 'r', libver='latest', swmr=True) as f:
+            data = f['/RPiData/data'][:]
+            meta = f['/RPiData/meta'][:] if '/RPiData/meta' in f else None
+
+    if fill:
+        data = fill_deadband(data)
+
+    return data, meta
+
+
+def load_streams(path):
+    """
+    Read the per-channel streams of a logger with scan schedule, in which every channel is read at its own rate
+
+    Parameters
+    ----------
+
+    path: str
+        path to the data.h5 file
+
+    Returns
+    -------
+    streams: dict of channel name to structured array with 'timestamp_data' and the channel values
+    """
+    prefix = 'stream_'
+    try:
+        with tb.open_file(path, 'r') as f:
+            return dict((node.name[len(prefix):], node[:]) for node in f.root.RPiData if node.name.startswith(prefix))
+    # See load_data
+    except (tb.HDF5ExtError, tb.NoSuchNodeError):
+        import h5py
+        with h5py.File(path, 'r', libver='latest', swmr=True) as f:
+            return dict((name[len(prefix):], f['/RPiData/' + name][:]) for name in f['/RPiData'] if name.startswith(prefix))
+
+
+def _open_table(path, name='data'):
+    # Open a table of the /RPiData group with PyTables or, for SWMR files PyTables cannot read, with h5py.
+    # Returns the open file and the table, which both support len() and slicing
+    f = None
+    try:
+        f = tb.open_file(path, 'r')
+        return f, f.get_node('/RPiData/' + name)
+    except (tb.HDF5ExtError, tb.NoSuchNodeError):
+        if f is not None:
+            f.close()
+        import h5py
+        f = h5py.File(path, 'r', libver='latest', swmr=True)
+        if '/RPiData/' + name not in f:
+            f.close()
+            raise KeyError('No table {} in {}'.format(name, path))
+        return f, f['/RPiData/' + name]
+
+
+def iter_chunks(path, name='data', chunk_size=100000):
+    """
+    Generator yielding the rows of a table in chunks of chunk_size rows, so large files are read with bounded memory
+
+    Parameters
+    ----------
+
+    path: str
+        path to the data.h5 file
+    name: str
+        name of the table in the /RPiData group
+    chunk_size: int
+        number of rows per chunk
+    """
+    f, table = _open_table(path, name)
+    try:
+        for start in range(0, len(table), chunk_size):
+            yield table[start:start + chunk_size]
+    finally:
+        f.close()
+
+
+def table_info(path, name='data'):
+    """
+    Number of rows, first and last row of a table without reading the whole table
+
+    Returns
+    -------
+    (n_rows, first, last): first and last are None for empty tables
+    """
+    f, table = _open_table(path, name)
+    try:
+        n_rows = len(table)
+        if not n_rows:
+            return 0, None, None
+        return n_rows, table[0], table[n_rows - 1]
+    finally:
+        f.close()
+
+
+def read_new(path, start=0, name='data'):
+    """
+    Read the rows of a table which were appended since row *start*. Works on files which are still being written
+    by a logger in SWMR mode; only the incremental tail is read.
+
+    Parameters
+    ----------
+
+    path: str
+        path to the data.h5 file
+    start: int
+        first row to read, usually the stop returned by the previous call
+    name: str
+        name of the table in the /RPiData group
+
+    Returns
+    -------
+    (rows, stop): structured array of new rows and index of the next row to read
+    """
+    import h5py
+
+    with h5py.File(path, 'r', libver='latest', swmr=True) as f:
+        dataset = f['/RPiData/' + name]
+        stop = dataset.shape[0]
+        return dataset[start:stop], stop
+
+
+def follow(path, name='data', interval=1., timeout=None):
+    """
+    Generator yielding the new rows of a table of a file written by a logger in SWMR mode, as they are flushed.
+    The file is kept open and polled every *interval* seconds.
+
+    Parameters
+    ----------
+
+    path: str
+        path to the data.h5 file
+    name: str
+        name of the table in the /RPiData group
+    interval: float
+        polling interval in seconds
+    timeout: float
+        stop after this many seconds without new rows; None to follow forever
+    """
+    import h5py
+
+    with h5py.File(path, 'r', libver='latest', swmr=True) as f:
+        dataset = f['/RPiData/' + name]
+        start = 0
+        last_rows = time.time()
+
+        while True:
+            dataset.refresh()
+            stop = dataset.shape[0]
+
+            if stop > start:
+                yield dataset[start:stop]
+                start = stop
+                last_rows = time.time()
+            elif timeout is not None and time.time() - last_rows > timeout:
+                return
+            else:
+                time.sleep(interval)
@@ -0,0 +1,215 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+class WelchPSD(object):
+    """
+    Streaming Welch estimate of the power spectral density (PSD) of every channel. Samples are collected into a block
+    of block_segments overlapping segments; all segments of all channels of a block are detrended, windowed and
+    transformed at once. Only the overlap to the next block is kept, so memory does not grow with the averaging time.
+    A spectrum, averaged over all segments since the last one, is produced every interval seconds of data.
+    Welch assumes uniformly sampled data: if the time between two samples exceeds max_gap sample periods, e.g. for
+    scans left out by the sender, the complete segments before the gap are transformed, the remaining samples are
+    dropped and the next segment starts after the gap, so no segment joins data across it. Without fs, the sample
+    period is the median of the recent intervals, so the jitter of the acquisition loop is not taken for gaps.
+
+    Parameters
+    ----------
+
+    channels: list
+        list of strings with names of channels
+    nperseg: int
+        number of samples per segment; the frequency resolution is fs / nperseg
+    overlap: float
+        overlap of consecutive segments as fraction of nperseg
+    interval: float
+        seconds of data averaged per spectrum; spectra are produced at block boundaries, so at least once per block
+    bands: dict
+        frequency bands {name: [f_low, f_high]} in Hz for which the RMS ripple in V is calculated per channel
+    fs: float
+        sample rate in Hz; None to estimate it from the timestamps of the samples
+    block_segments: int
+        number of segments transformed at once
+    max_gap: float
+        time between two samples, in sample periods, above which the data is treated as interrupted
+    """
+
+    # Number of recent sample intervals of which the median is the sample period, and how often it is updated
+    n_period_intervals = 256
+    period_update = 32
+
+    def __init__(self, channels, nperseg=1024, overlap=0.5, interval=10., bands=None, fs=None, block_segments=4, max_gap=3.):
+
+        self.channels = channels
+        self.nperseg = int(nperseg)
+        self.step = max(1, self.nperseg - int(overlap * self.nperseg))
+        self.interval = interval
+        self.bands = sorted(bands.items()) if bands else []
+        self.fs = fs
+        self.block_segments = int(block_segments)
+        self.max_gap = max_gap
+
+        # Periodic Hann window
+        self.window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(self.nperseg) / self.nperseg)
+        self.n_freqs = self.nperseg // 2 + 1
+
+        # Block of samples; the last nperseg - step samples are kept as start of the next block
+        self._block = np.zeros(shape=(self.nperseg + (self.block_segments - 1) * self.step, len(channels)), dtype=np.float64)
+        self._n_block = 0
+
+        # Last value per channel, which replaces NaN values of channels not received in deadband mode
+        self._last = np.zeros(len(channels))
+
+        # Accumulated squared magnitude of the spectra of all segments since the last spectrum
+        self._sum = np.zeros(shape=(self.n_freqs, len(channels)))
+        self._n_segments = 0
+        self._n_gaps = 0
+        self._first = None
+        self._last_timestamp = None
+
+        # Sum and number of the sample intervals without gaps, for the estimate of fs
+        self._span = 0.
+        self._n_intervals = 0
+
+        # Recent sample intervals without gaps and their median, the sample period for the gap detection
+        self._intervals = np.zeros(self.n_period_intervals)
+        self._period = None
+
+        # Statistics
+        self.n_spectra = 0
+        self.n_gaps = 0
+
+    @property
+    def dtype(self):
+        """Data type of the spectra table: PSD in V^2/Hz, total RMS noise and RMS ripple per band in V per channel"""
+        spectra_type = [('timestamp', '<f8'), ('duration', '<f4'), ('fs', '<f4'), ('n_segments', '<u4'), ('n_gaps', '<u4')]
+        for ch in self.channels:
+            spectra_type += [(ch + '_psd', '<f4', (self.n_freqs,)), (ch + '_rms', '<f4')]
+            spectra_type += [('{}_{}'.format(ch, band), '<f4') for band, _ in self.bands]
+        return np.dtype(spectra_type)
+
+    def add(self, timestamp, values):
+        """
+        Add a single sample of all channels
+
+        Returns
+        -------
+        list of spectra, see spectrum; empty until interval seconds of data were averaged
+        """
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        if missing.any():
+            values = np.where(missing, self._last, values)
+        self._last = values
+
+        if self._last_timestamp is not None:
+            interval = timestamp - self._last_timestamp
+            period = 1. / self.fs if self.fs else self._period
+            if period is not None and interval > self.max_gap * period:
+                # Use the complete segments before the gap and restart the segment after it
+                if self._n_block >= self.nperseg:
+                    self._process(n_segments=(self._n_block - self.nperseg) // self.step + 1)
+                self._n_block = 0
+                self._n_gaps += 1
+                self.n_gaps += 1
+            elif interval > 0:
+                self._intervals[self._n_intervals % self.n_period_intervals] = interval
+                self._span += interval
+                self._n_intervals += 1
+                if self._n_intervals < self.period_update or self._n_intervals % self.period_update == 0:
+                    self._period = np.median(self._intervals[:min(self._n_intervals, self.n_period_intervals)])
+
+        self._block[self._n_block] = values
+        self._n_block += 1
+
+        if self._first is None:
+            self._first = timestamp
+        self._last_timestamp = timestamp
+
+        if self._n_block < self._block.shape[0]:
+            return []
+
+        self._process()
+
+        if self._last_timestamp - self._first >= self.interval:
+            return [self.spectrum()]
+        return []
+
+    def _process(self, n_segments=None):
+        # Transform the first n_segments (default all) segments of the block at once: view of shape
+        # (segments, nperseg, channels) on the block
+        n_segments = self.block_segments if n_segments is None else n_segments
+        block = self._block
+        segments = as_strided(block, shape=(n_segments, self.nperseg, block.shape[1]),
+                              strides=(self.step * block.strides[0], block.strides[0], block.strides[1]), writeable=False)
+
+        segments = (segments - segments.mean(axis=1, keepdims=True)) * self.window[None, :, None]
+        spectra = np.fft.rfft(segments, axis=1)
+        self._sum += (spectra.real ** 2 + spectra.imag ** 2).sum(axis=0)
+        self._n_segments += n_segments
+
+        # Keep the overlap to the next block
+        n_keep = block.shape[0] - self.block_segments * self.step
+        block[:n_keep] = block[self.block_segments * self.step:]
+        self._n_block = n_keep
+
+    def spectrum(self):
+        """
+        Average of all segments since the last spectrum; resets the average
+
+        Returns
+        -------
+        dict with 'timestamp' of the first sample, 'duration', 'fs', 'n_segments', 'n_gaps', 'frequencies', 'psd' of
+        shape (n_freqs, n_channels) in V^2/Hz, 'rms' noise per channel and 'ripple' per band and channel in V
+        """
+        duration = self._last_timestamp - self._first
+        # Estimated from the sample intervals without gaps
+        fs = self.fs or (self._n_intervals / self._span if self._span > 0 else 1.)
+
+        # One-sided density; DC and Nyquist bins are not doubled
+        psd = self._sum / (self._n_segments * fs * np.square(self.window).sum())
+        psd[1:-1 if self.nperseg % 2 == 0 else None] *= 2
+
+        frequencies = np.arange(self.n_freqs) * fs / self.nperseg
+        df = fs / self.nperseg
+
+        result = {'timestamp': self._first, 'duration': duration, 'fs': fs, 'n_segments': self._n_segments, 'n_gaps': self._n_gaps,
+                  'frequencies': frequencies, 'psd': psd,
+                  'rms': np.sqrt(psd[1:].sum(axis=0) * df),
+                  'ripple': dict((band, np.sqrt(psd[(frequencies >= f[0]) & (frequencies <= f[1])].sum(axis=0) * df))
+                                 for band, f in self.bands)}
+
+        self._sum[:] = 0
+        self._n_segments = 0
+        self._n_gaps = 0
+        # The next average starts at the last sample
+        self._first = self._last_timestamp
+        self.n_spectra += 1
+
+        return result
+
+    def flush(self):
+        """Spectrum of the remaining full blocks, if any; call at the end of the data"""
+        return [self.spectrum()] if self._n_segments else []
+
+    def to_array(self, result):
+        """Row of the spectra table of a spectrum"""
+        row = np.zeros(shape=1, dtype=self.dtype)
+        for key in ('timestamp', 'duration', 'fs', 'n_segments', 'n_gaps'):
+            row[key] = result[key]
+        for i, ch in enumerate(self.channels):
+            row[ch + '_psd'] = result['psd'][:, i]
+            row[ch + '_rms'] = result['rms'][i]
+            for band, _ in self.bands:
+                row['{}_{}'.format(ch, band)] = result['ripple'][band][i]
+        return row
+
+    def to_json(self, result):
+        """Message of a spectrum to be sent via ZMQ, e.g. to the monitor"""
+        return {'meta': {'timestamp': result['timestamp'], 'duration': result['duration'], 'fs': result['fs'],
+                         'n_segments': result['n_segments'], 'n_gaps': result['n_gaps']},
+                'frequencies': result['frequencies'].tolist(),
+                'psd': dict((ch, result['psd'][:, i].tolist()) for i, ch in enumerate(self.channels)),
+                'rms': dict((ch, float(result['rms'][i])) for i, ch in enumerate(self.channels)),
+                'ripple': dict((ch, dict((band, float(result['ripple'][band][i])) for band, _ in self.bands))
+                               for i, ch in enumerate(self.channels))}